@@ -17,6 +17,7 @@ class ApiServer:
         self.api = None
         self.host = None
         self.helper = NodeHelper()
+        self.node_router = None
         self.app = Quart(__name__)
         self.app = cors(self.app, allow_origin="*")
         self.register_routes()
@@ -37,8 +38,8 @@ class ApiServer:
         """
         Registers the routes for the application by attaching the blueprint from NodeRoutes.
         """
-        node_router = NodeRouter()
-        self.app.register_blueprint(node_router.get_blueprint())
+        self.node_router = NodeRouter()
+        self.app.register_blueprint(self.node_router.get_blueprint())
 
     def setup_app_hooks(self):
         """
@@ -46,8 +47,15 @@ class ApiServer:
         """
         @self.app.before_serving
         async def startup():
+            await self.node_router.node_controller.node_service.schema.ensure()
+            self.node_router.node_controller.refresher.start()
             self.logger.info("::setup_app_hooks::Application startup complete.")
 
+        @self.app.after_serving
+        async def shutdown():
+            await self.node_router.node_controller.refresher.stop()
+            self.logger.info("::setup_app_hooks::Application shutdown complete.")
+
     def start_server(self):
         """
         Starts the Uvicorn server to run the Quart application.
@@ -1,14 +1,21 @@
 import os
-from neo4j import AsyncGraphDatabase
+import time
+from urllib.parse import urlparse
+from neo4j import AsyncGraphDatabase, READ_ACCESS, WRITE_ACCESS
 from dotenv import load_dotenv
-from quart import g
+from quart import g, has_app_context
 import logging
+from api.db.query_registry import QueryRegistry, READ, WRITE
 
 
 class AsyncSessionManager:
 
-    def __init__(self):
+    def __init__(self, registry=None):
+        """
+        :param registry: The QueryRegistry declaring the queries run with execute_read and execute_write (optional).
+        """
         self.logger = logging.getLogger('quart_app.db.neo4j_manager')
+        self.registry = registry or QueryRegistry()
         if not hasattr(self, "_initialized"):
             self.logger.debug("::__init__:: Initializing AsyncSessionManager.")
             load_dotenv()
@@ -20,12 +27,21 @@ class AsyncSessionManager:
                 self.logger.critical(f"::__init__:: Missing connection details in .env file: {', '.join(missing_configs)}")
                 raise EnvironmentError(f"Missing connection details in .env file: {', '.join(missing_configs)}")
 
+            self._database = os.getenv('NEO4J_DATABASE') or None
             try:
                 self._driver = AsyncGraphDatabase.driver(
                     self._uri,
                     auth=(self._user, self._password),
-                    max_connection_pool_size=50
+                    max_connection_pool_size=int(os.getenv('NEO4J_MAX_POOL_SIZE', '50')),
+                    connection_acquisition_timeout=float(os.getenv('NEO4J_ACQUISITION_TIMEOUT', '60')),
+                    liveness_check_timeout=float(os.getenv('NEO4J_LIVENESS_CHECK_TIMEOUT', '30')),
+                    max_connection_lifetime=float(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', '3600')),
+                    max_transaction_retry_time=float(os.getenv('NEO4J_MAX_RETRY_TIME', '15'))
                 )
+                if urlparse(self._uri).scheme.startswith('neo4j'):
+                    self.logger.info("::__init__:: Cluster routing enabled, reads are spread across read replicas.")
+                else:
+                    self.logger.info("::__init__:: Direct connection, use a neo4j:// URI to route reads in a cluster.")
                 self.logger.info("::__init__:: Neo4j driver successfully created.")
             except Exception as e:
                 self.logger.critical(f"::__init__:: Unexpected error occurred while initializing Neo4j driver: {e}")
@@ -43,10 +59,13 @@ class AsyncSessionManager:
         except Exception as e:
             self.logger.error(f"::get_session:: Error occurred while getting Neo4j session: {e}")
 
+    def _session(self, access_mode=READ_ACCESS):
+        return self._driver.session(database=self._database, default_access_mode=access_mode)
+
     def _create_session(self):
         self.logger.info("::_create_session:: Creating a new Neo4j session.")
         try:
-            session = self._driver.session()
+            session = self._session()
             self.logger.debug("::_create_session:: Neo4j session created successfully.")
             return session
         except Exception as e:
@@ -64,7 +83,7 @@ class AsyncSessionManager:
     async def _close_session(self):
         self.logger.debug("::_close_session:: Attempting to close the current Neo4j session.")
         try:
-            if hasattr(g, 'neo4j_session'):
+            if has_app_context() and hasattr(g, 'neo4j_session'):
                 await g.neo4j_session.close()
                 del g.neo4j_session
                 self.logger.info("::_close_session:: Neo4j session successfully closed.")
@@ -74,17 +93,105 @@ class AsyncSessionManager:
             self.logger.error(f"::_close_session:: Error occurred while closing Neo4j session: {e}")
 
     async def execute_query(self, query, parameters=None):
+        """
+        Runs an ad hoc statement, such as a schema command, in its own write session.
+
+        :param query: The Cypher statement.
+        :param parameters: Query parameters (optional).
+        :return: A list of record dictionaries, or None if the statement failed.
+        """
         self.logger.debug(f"::execute_query:: Executing query: {query} | Parameters: {parameters}")
         try:
-            session = await self.get_session()
-            self.logger.debug("::execute_query:: Session obtained successfully.")
-            tx = await session.begin_transaction()
-            self.logger.debug("::execute_query:: Transaction started successfully.")
-            async with tx:
-                result = await tx.run(query, parameters or {})
-                self.logger.debug("::execute_query:: Query executed successfully.")
-                records = [record.data() async for record in result]
-                self.logger.info(f"::execute_query:: Query returned {len(records)} records.")
-                return records
+            async with self._session(WRITE_ACCESS) as session:
+                return await self._run_in_transaction(session, query, parameters)
         except Exception as e:
             self.logger.critical(f"::execute_query:: An unexpected error occurred: {e}")
+
+    async def _run_in_transaction(self, session, query, parameters=None):
+        tx = await session.begin_transaction()
+        self.logger.debug("::_run_in_transaction:: Transaction started successfully.")
+        async with tx:
+            result = await tx.run(query, parameters or {})
+            self.logger.debug("::_run_in_transaction:: Query executed successfully.")
+            records = [record.data() async for record in result]
+            self.logger.info(f"::_run_in_transaction:: Query returned {len(records)} records.")
+            return records
+
+    async def execute_read(self, name, parameters=None):
+        """
+        Runs a registered read query in a managed read transaction, which the driver retries on transient
+        errors and routes to a read replica in a cluster.
+
+        :param name: The registered query name.
+        :param parameters: Query parameters matching the registered schema (optional).
+        :return: A list of record dictionaries, or None if the query failed.
+        """
+        return await self._execute_registered(name, parameters, READ)
+
+    async def execute_write(self, name, parameters=None):
+        """
+        Runs a registered write query in a managed write transaction.
+
+        :param name: The registered query name.
+        :param parameters: Query parameters matching the registered schema (optional).
+        :return: A list of record dictionaries, or None if the query failed.
+        """
+        return await self._execute_registered(name, parameters, WRITE)
+
+    async def _execute_registered(self, name, parameters, mode):
+        query = self.registry.get(name)
+        if query.mode != mode:
+            raise ValueError(f"Query {name} is registered as a {query.mode} query.")
+        parameters = query.validate(parameters)
+        self.logger.debug(f"::_execute_registered:: Executing {mode} query {name} | Parameters: {parameters}")
+
+        async def work(tx):
+            result = await tx.run(query.text, parameters)
+            return [record.data() async for record in result]
+
+        started = time.perf_counter()
+        try:
+            if not has_app_context():
+                async with self._session(READ_ACCESS if mode == READ else WRITE_ACCESS) as session:
+                    records = await self._execute_work(session, mode, work)
+            else:
+                records = await self._execute_work(await self.get_session(), mode, work)
+            self.registry.observe(name, time.perf_counter() - started)
+            self.logger.info(f"::_execute_registered:: Query {name} returned {len(records)} records.")
+            return records
+        except Exception as e:
+            self.registry.observe(name, time.perf_counter() - started, failed=True)
+            self.logger.critical(f"::_execute_registered:: Query {name} failed: {e}")
+
+    @staticmethod
+    async def _execute_work(session, mode, work):
+        if mode == READ:
+            return await session.execute_read(work)
+        return await session.execute_write(work)
+
+    async def stream_read(self, name, parameters=None):
+        """
+        Streams a registered read query in its own read session, yielding records as the driver receives them.
+
+        :param name: The registered query name.
+        :param parameters: Query parameters matching the registered schema (optional).
+        :return: An async generator of record dictionaries.
+        """
+        query = self.registry.get(name)
+        if query.mode != READ:
+            raise ValueError(f"Query {name} is registered as a {query.mode} query.")
+        parameters = query.validate(parameters)
+        self.logger.debug(f"::stream_read:: Streaming query {name} | Parameters: {parameters}")
+        started = time.perf_counter()
+        failed = True
+        try:
+            async with self._session() as session:
+                result = await session.run(query.text, parameters)
+                count = 0
+                async for record in result:
+                    count += 1
+                    yield record.data()
+            failed = False
+            self.logger.info(f"::stream_read:: Query {name} streamed {count} records.")
+        finally:
+            self.registry.observe(name, time.perf_counter() - started, failed)
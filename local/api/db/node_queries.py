@@ -0,0 +1,107 @@
+from itertools import combinations
+from api.db.query_registry import QueryRegistry
+
+NODE_PROJECTION = """
+RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.client AS Client, n.os AS OS, n.status AS Status,
+       n.latitude AS Latitude, n.longitude AS Longitude, n.isp AS ISP, n.country_name AS Country, n.created_at AS CreatedAt,
+       coalesce(n.os_category, 'Other OSs') AS OSType,
+       coalesce(n.client_category, 'Other Clients') AS ClientType,
+       coalesce(n.isp_category, 'Other ISPs') AS ISPType
+ORDER BY NodeId
+"""
+
+# Filter names mapped to the lower-cased shadow properties the ingestion scripts maintain and index.
+FILTER_PROPERTIES = {
+    "country": "country_name_lower",
+    "os": "os_lower",
+    "client": "client_lower",
+    "isp": "isp_lower",
+}
+
+NODE_QUERIES = QueryRegistry()
+
+NODE_QUERIES.register("data_versions", """
+MATCH (m:Meta)
+WHERE m.version IS NOT NULL
+RETURN m.name AS name, m.version AS version
+""")
+
+NODE_QUERIES.register("snapshot", """
+MATCH (n:Node)
+WHERE n.id IS NOT NULL""" + NODE_PROJECTION)
+
+NODE_QUERIES.register("os_types", """
+MATCH (n:Node)
+RETURN DISTINCT n.os AS OS
+""")
+
+NODE_QUERIES.register("clients", """
+MATCH (n:Node)
+RETURN DISTINCT n.client AS Client
+""")
+
+NODE_QUERIES.register("isps", """
+MATCH (n:Node)
+RETURN DISTINCT n.isp AS ISP
+""")
+
+NODE_QUERIES.register("node_ids", """
+MATCH (n:Node)
+RETURN DISTINCT n.id AS NodeID
+""")
+
+NODE_QUERIES.register("node_details", """
+MATCH (n:Node {id: $node_id})
+RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.client AS Client, n.os AS OS, n.status AS Status,
+       n.latitude AS Latitude, n.longitude AS Longitude, n.isp AS ISP, n.country_name AS Country, n.created_at AS CreatedAt
+""", {"node_id": str})
+
+NODE_QUERIES.register("latest_nodes", """
+MATCH (n:Node)
+RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.created_at AS CreatedAt,
+       n.country_name AS Country, n.client AS Client, n.os AS OS, n.isp AS ISP
+ORDER BY n.created_at DESC
+LIMIT $limit
+""", {"limit": int})
+
+NODE_QUERIES.register("relationships", """
+MATCH (root:Root {name: 'World'})-[:HAS_COUNTRY]->(c:Country {name: $country_name})-[:HAS_ISP]->(isp:ISP)
+-[:HAS_OS]->(os:OS)-[:HAS_CLIENT]->(client:Client)-[:HAS_NODE]->(n:Node)
+RETURN root, c, isp, os, client, n
+""", {"country_name": str})
+
+NODE_QUERIES.register("relationship_graph", """
+MATCH (:Root {name: 'World'})-[:HAS_COUNTRY]->(c:Country {name: $country_name})-[:HAS_ISP]->(isp:ISP)
+-[:HAS_OS]->(os:OS)-[:HAS_CLIENT]->(client:Client)-[:HAS_NODE]->(n:Node)
+RETURN isp.name AS ISP, os.name AS OS, client.name AS Client, n.id AS NodeId
+""", {"country_name": str})
+
+
+def filter_query_name(names):
+    """
+    Names the filtered node query for a set of filters.
+
+    :param names: Filter names of FILTER_PROPERTIES, in FILTER_PROPERTIES order.
+    :return: The registered query name.
+    """
+    return "filtered_nodes" + "".join(f"_{name}" for name in names)
+
+
+# One query per filter combination, each with only the predicates it needs, so the planner can seek the
+# indexes on the lower-cased properties instead of evaluating `$x IS NULL OR ...` on every node.
+for size in range(len(FILTER_PROPERTIES) + 1):
+    for names in combinations(FILTER_PROPERTIES, size):
+        where = " AND ".join(f"n.{FILTER_PROPERTIES[name]} = ${name}" for name in names) or "n.id IS NOT NULL"
+        NODE_QUERIES.register(filter_query_name(names), "\nMATCH (n:Node)\nWHERE " + where + NODE_PROJECTION,
+                              {name: str for name in names})
+
+
+def build_filter_query(filters):
+    """
+    Picks the filtered node query for the supplied filters and lower-cases their values.
+
+    :param filters: Filter names of FILTER_PROPERTIES mapped to the wanted value; None values are left out.
+    :return: A tuple of the registered query name and its parameters.
+    """
+    parameters = {name: filters[name].lower() for name in FILTER_PROPERTIES if filters.get(name) is not None}
+    return filter_query_name(parameters), parameters
@@ -0,0 +1,165 @@
+from bisect import bisect_left
+
+READ = "read"
+WRITE = "write"
+
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is unbounded.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class RegisteredQuery:
+    """
+    A named Cypher query with the parameters it accepts and whether it reads or writes.
+    """
+
+    def __init__(self, name, text, parameters=None, mode=READ):
+        """
+        :param name: The unique query name.
+        :param text: The Cypher text; it never changes, so the database reuses one cached plan.
+        :param parameters: Parameter names mapped to the accepted Python type or tuple of types (optional).
+        :param mode: READ or WRITE.
+        """
+        if mode not in (READ, WRITE):
+            raise ValueError(f"Invalid mode for query {name}: {mode}")
+        self.name = name
+        self.text = text
+        self.parameters = parameters or {}
+        self.mode = mode
+
+    def validate(self, parameters):
+        """
+        Checks query parameters against the declared schema.
+
+        :param parameters: The parameters of one execution.
+        :return: The parameters as a dictionary.
+        """
+        parameters = parameters or {}
+        missing = self.parameters.keys() - parameters.keys()
+        unexpected = parameters.keys() - self.parameters.keys()
+        if missing or unexpected:
+            raise ValueError(f"Query {self.name} expects parameters {sorted(self.parameters)}, "
+                             f"missing {sorted(missing)}, unexpected {sorted(unexpected)}.")
+        for name, expected in self.parameters.items():
+            if not isinstance(parameters[name], expected):
+                raise TypeError(f"Parameter {name} of query {self.name} has type {type(parameters[name]).__name__}.")
+        return parameters
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of query latencies, cheap enough to update on every execution.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds, failed=False):
+        """
+        Records one execution.
+
+        :param seconds: The execution time in seconds.
+        :param failed: Whether the execution raised.
+        """
+        milliseconds = seconds * 1000
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.errors += failed
+        self.total_ms += milliseconds
+        self.max_ms = max(self.max_ms, milliseconds)
+
+    def quantile(self, q):
+        """
+        Estimates a latency quantile as the upper bound of the bucket it falls into.
+
+        :param q: The quantile between 0 and 1.
+        :return: The latency in milliseconds, or None without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def summary(self):
+        """
+        :return: A dictionary with the execution and error counts, mean, p50, p95, p99 and max latency in ms.
+        """
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class QueryRegistry:
+    """
+    Declares the queries an application runs once, by name, and keeps a latency histogram per query.
+    """
+
+    def __init__(self):
+        self._queries = {}
+        self._latencies = {}
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def register(self, name, text, parameters=None, mode=READ):
+        """
+        Declares a query.
+
+        :param name: The unique query name.
+        :param text: The Cypher text.
+        :param parameters: Parameter names mapped to the accepted Python type or tuple of types (optional).
+        :param mode: READ or WRITE.
+        :return: The RegisteredQuery.
+        """
+        if name in self._queries:
+            raise ValueError(f"Query {name} is already registered.")
+        query = RegisteredQuery(name, text, parameters, mode)
+        self._queries[name] = query
+        self._latencies[name] = LatencyHistogram()
+        return query
+
+    def get(self, name):
+        """
+        :param name: The query name.
+        :return: The RegisteredQuery.
+        """
+        try:
+            return self._queries[name]
+        except KeyError:
+            raise KeyError(f"Unknown query: {name}") from None
+
+    def observe(self, name, seconds, failed=False):
+        """
+        Records one execution of a query.
+
+        :param name: The query name.
+        :param seconds: The execution time in seconds.
+        :param failed: Whether the execution raised.
+        """
+        self._latencies[name].observe(seconds, failed)
+
+    def slowest(self, limit=None):
+        """
+        Lists the executed queries, slowest first by p95 and then by mean latency.
+
+        :param limit: The maximum number of queries to return (optional).
+        :return: A list of latency summaries with the query name and mode.
+        """
+        summaries = [{"name": name, "mode": self._queries[name].mode, **histogram.summary()}
+                     for name, histogram in self._latencies.items() if histogram.count]
+        summaries.sort(key=lambda summary: (summary["p95_ms"], summary["mean_ms"]), reverse=True)
+        return summaries[:limit] if limit is not None else summaries
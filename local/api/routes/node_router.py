@@ -1,8 +1,16 @@
 import logging
+import math
 from quart import Blueprint, abort, request
+from werkzeug.exceptions import HTTPException
 from api.controllers.node_controller import NodeController
+from api.services.node_service import (SUMMARY_METRICS, DEFAULT_SUMMARY_METRICS, STATISTICS_DIMENSIONS, TREE_LEVELS,
+                                      HEATMAP_RESOLUTIONS)
+from api.services.spatial_index import WORLD_BBOX
 from api.utils.node_helper import NodeHelper
 
+MAX_ZOOM = 20
+MAX_RADIUS_KM = 20037.5
+
 
 class NodeRouter:
     def __init__(self):
@@ -33,11 +41,20 @@ class NodeRouter:
                                       methods=['GET'])
             self.node_bp.add_url_rule('/nodes/relationships/<country_name>', 'get_relationships', self._get_relationships,
                                       methods=['GET'])
+            self.node_bp.add_url_rule('/nodes/within', 'get_nodes_within', self._get_nodes_within, methods=['GET'])
+            self.node_bp.add_url_rule('/nodes/near', 'get_nodes_near', self._get_nodes_near, methods=['GET'])
+            self.node_bp.add_url_rule('/nodes/clusters', 'get_clusters', self._get_clusters, methods=['GET'])
+            self.node_bp.add_url_rule('/nodes/tree', 'get_tree', self._get_tree, methods=['GET'])
             self.node_bp.add_url_rule('/nodes/count', 'get_node_count', self._get_summary_counts, methods=['GET'])
             self.node_bp.add_url_rule('/nodes/latest', 'get_latest_nodes', self._get_latest_nodes, methods=['GET'])
             self.node_bp.add_url_rule('/nodes/filter', 'get_filter_nodes', self._get_filtered_nodes, methods=['GET'])
             self.node_bp.add_url_rule('/statistics/<data_type>', 'get_statistics', self._get_statistics,
                                       methods=['GET'])
+            self.node_bp.add_url_rule('/statistics/country/choropleth', 'get_choropleth', self._get_choropleth,
+                                      methods=['GET'])
+            self.node_bp.add_url_rule('/nodes/heatmap', 'get_heatmap', self._get_heatmap, methods=['GET'])
+            self.node_bp.add_url_rule('/ready', 'get_readiness', self._get_readiness, methods=['GET'])
+            self.node_bp.add_url_rule('/stats/queries', 'get_query_stats', self._get_query_stats, methods=['GET'])
             self.logger.info("::register_routes:: All routes have been successfully registered.")
         except Exception as e:
             self.logger.exception(f"::register_routes:: Failed to register routes: {e}")
@@ -51,15 +68,58 @@ class NodeRouter:
         self.logger.debug("::get_blueprint:: Returning the Blueprint with all registered routes.")
         return self.node_bp
 
+    def _get_listing_options(self):
+        """
+        Reads the pagination and streaming options shared by the node listing routes.
+
+        :return: A tuple of (after, limit, stream).
+        """
+        after = request.args.get('after') or None
+        limit = request.args.get('limit', default=None, type=int)
+        if 'limit' in request.args and (limit is None or limit <= 0):
+            self.logger.warning(f"::_get_listing_options:: Invalid limit value received: {request.args.get('limit')}")
+            abort(400, description="Invalid limit value. Must be greater than zero.")
+        stream = (request.args.get('stream', '').lower() in ('1', 'true')
+                  or 'application/x-ndjson' in request.headers.get('Accept', ''))
+        return after, limit, stream
+
+    def _get_bbox(self):
+        """
+        Reads the 'bbox' argument, given as west,south,east,north in degrees like Leaflet's toBBoxString().
+
+        :return: A (west, south, east, north) tuple; the whole world when the argument is missing.
+        """
+        raw = request.args.get('bbox')
+        if not raw:
+            return WORLD_BBOX
+        try:
+            west, south, east, north = (float(part) for part in raw.split(','))
+        except ValueError:
+            self.logger.warning(f"::_get_bbox:: Invalid bbox value received: {raw}")
+            abort(400, description="Invalid bbox value. Expected west,south,east,north in degrees.")
+        if not all(math.isfinite(value) for value in (west, south, east, north)) or south > north:
+            self.logger.warning(f"::_get_bbox:: Invalid bbox value received: {raw}")
+            abort(400, description="Invalid bbox value. Expected west,south,east,north in degrees.")
+        return west, south, east, north
+
     async def _get_nodes(self):
         """
         Handles GET requests to retrieve all nodes.
 
-        :return: The response from the NodeController's get_nodes method.
+        Supports keyset pagination with 'limit' and 'after', and NDJSON streaming with 'stream=1' or
+        'Accept: application/x-ndjson'.
+
+        :return: The response from the NodeController's get_nodes, get_node_page or stream_nodes method.
         """
+        after, limit, stream = self._get_listing_options()
         try:
             self.logger.debug("::_get_nodes:: Handling request to get all nodes.")
-            response = await self.node_controller.get_nodes()
+            if stream:
+                response = await self.node_controller.stream_nodes(after, limit)
+            elif limit is not None or after is not None:
+                response = await self.node_controller.get_node_page(after, limit)
+            else:
+                response = await self.node_controller.get_nodes(request.headers)
             self.logger.info("::_get_nodes:: Successfully retrieved all nodes.")
             self.logger.debug("::_get_nodes:: Exiting _get_nodes.")
             return response
@@ -104,7 +164,7 @@ class NodeRouter:
         """
         try:
             self.logger.debug("::_get_countries:: Handling request to get countries.")
-            response = await self.node_controller.get_countries()
+            response = await self.node_controller.get_countries(request.headers)
             self.logger.info("::_get_countries:: Successfully retrieved countries.")
             self.logger.debug("::_get_countries:: Exiting _get_countries.")
             return response
@@ -162,35 +222,182 @@ class NodeRouter:
 
     async def _get_relationships(self, country_name):
         """
-        Handles GET requests to retrieve relationships based on country name.
+        Handles GET requests to retrieve relationships based on country name. With 'format=graph' the
+        relationships are returned as a deduplicated node table plus index-based links.
 
         :param country_name: The name of the country to filter relationships by.
         :return: The response from the NodeController's get_relationships method.
         """
         self.logger.debug(f"::_get_relationships:: Handling request to get relationships for country: {country_name}.")
+        graph = request.args.get('format') == 'graph'
         try:
-            countries_response, status_code = await self.node_controller.get_countries()
-            countries_data = await countries_response.get_json()
-            self.logger.debug(f"::_get_relationships:: Available countries: {countries_data}")
-            if country_name not in countries_data:
+            if not await self.node_controller.is_known_value("country", country_name):
                 self.logger.warning(f"::_get_relationships:: Country {country_name} not found.")
                 abort(404, description=f"Country {country_name} not found")
-            response = await self.node_controller.get_relationships(country_name)
+            response = await self.node_controller.get_relationships(country_name, graph, request.headers)
             self.logger.info(f"::_get_relationships:: Successfully retrieved relationships for country: {country_name}.")
             self.logger.debug("::_get_relationships:: Exiting _get_relationships.")
             return response
+        except HTTPException:
+            raise
         except Exception as e:
             self.logger.exception(f"::_get_relationships:: Error in _get_relationships for country {country_name}: {e}")
 
+    def _get_positive_limit(self):
+        """
+        Reads the optional 'limit' argument.
+
+        :return: The limit, or None when it is not given.
+        """
+        limit = request.args.get('limit', default=None, type=int)
+        if 'limit' in request.args and (limit is None or limit <= 0):
+            self.logger.warning(f"::_get_positive_limit:: Invalid limit value received: {request.args.get('limit')}")
+            abort(400, description="Invalid limit value. Must be greater than zero.")
+        return limit
+
+    async def _get_nodes_within(self):
+        """
+        Handles GET requests to retrieve the nodes inside the bounding box given by the 'bbox' argument.
+
+        :return: The response from the NodeController's get_nodes_within method.
+        """
+        if not request.args.get('bbox'):
+            self.logger.warning("::_get_nodes_within:: Missing bbox argument.")
+            abort(400, description="Missing bbox argument. Expected west,south,east,north in degrees.")
+        bbox = self._get_bbox()
+        limit = self._get_positive_limit()
+        try:
+            self.logger.debug(f"::_get_nodes_within:: Handling request to get nodes within bbox: {bbox}.")
+            response = await self.node_controller.get_nodes_within(bbox, limit)
+            self.logger.info("::_get_nodes_within:: Successfully retrieved nodes within bbox.")
+            self.logger.debug("::_get_nodes_within:: Exiting _get_nodes_within.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_nodes_within:: Error in _get_nodes_within: {e}")
+
+    async def _get_nodes_near(self):
+        """
+        Handles GET requests to retrieve the nodes within 'radius' kilometers of the 'lat'/'lon' location.
+
+        :return: The response from the NodeController's get_nodes_near method.
+        """
+        latitude = request.args.get('lat', type=float)
+        longitude = request.args.get('lon', type=float)
+        radius = request.args.get('radius', type=float)
+        if latitude is None or longitude is None or not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            self.logger.warning(f"::_get_nodes_near:: Invalid location received: {request.args.get('lat')}, {request.args.get('lon')}")
+            abort(400, description="Invalid location. 'lat' must be within -90..90 and 'lon' within -180..180.")
+        if radius is None or not 0 < radius <= MAX_RADIUS_KM:
+            self.logger.warning(f"::_get_nodes_near:: Invalid radius received: {request.args.get('radius')}")
+            abort(400, description=f"Invalid radius. Must be greater than 0 and at most {MAX_RADIUS_KM:.0f} km.")
+        limit = self._get_positive_limit()
+        try:
+            self.logger.debug(f"::_get_nodes_near:: Handling request to get nodes within {radius} km of {latitude}, {longitude}.")
+            response = await self.node_controller.get_nodes_near(latitude, longitude, radius, limit)
+            self.logger.info("::_get_nodes_near:: Successfully retrieved nodes near location.")
+            self.logger.debug("::_get_nodes_near:: Exiting _get_nodes_near.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_nodes_near:: Error in _get_nodes_near: {e}")
+
+    async def _get_heatmap(self):
+        """
+        Handles GET requests to retrieve the node density grid. The optional 'resolution' argument selects the
+        cell size in degrees.
+
+        :return: The response from the NodeController's get_heatmap method.
+        """
+        resolution = request.args.get('resolution', default=0.5, type=float)
+        if resolution not in HEATMAP_RESOLUTIONS:
+            self.logger.warning(f"::_get_heatmap:: Invalid resolution received: {request.args.get('resolution')}")
+            abort(400, description=f"Invalid resolution. Must be one of {', '.join(str(r) for r in HEATMAP_RESOLUTIONS)}.")
+        try:
+            self.logger.debug(f"::_get_heatmap:: Handling request to get heatmap at resolution: {resolution}.")
+            response = await self.node_controller.get_heatmap(resolution, request.headers)
+            self.logger.info("::_get_heatmap:: Successfully retrieved heatmap.")
+            self.logger.debug("::_get_heatmap:: Exiting _get_heatmap.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_heatmap:: Error in _get_heatmap: {e}")
+
+    async def _get_choropleth(self):
+        """
+        Handles GET requests to retrieve node counts and classes per country for choropleth maps.
+
+        :return: The response from the NodeController's get_choropleth method.
+        """
+        try:
+            self.logger.debug("::_get_choropleth:: Handling request to get choropleth.")
+            response = await self.node_controller.get_choropleth(request.headers)
+            self.logger.info("::_get_choropleth:: Successfully retrieved choropleth.")
+            self.logger.debug("::_get_choropleth:: Exiting _get_choropleth.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_choropleth:: Error in _get_choropleth: {e}")
+
+    async def _get_clusters(self):
+        """
+        Handles GET requests to retrieve server-side node clusters for a map viewport, given by the 'bbox' and
+        'zoom' arguments.
+
+        :return: The response from the NodeController's get_clusters method.
+        """
+        bbox = self._get_bbox()
+        zoom = request.args.get('zoom', type=int)
+        if zoom is None or not 0 <= zoom <= MAX_ZOOM:
+            self.logger.warning(f"::_get_clusters:: Invalid zoom value received: {request.args.get('zoom')}")
+            abort(400, description=f"Invalid zoom value. Must be an integer between 0 and {MAX_ZOOM}.")
+        try:
+            self.logger.debug(f"::_get_clusters:: Handling request to get clusters for bbox: {bbox}, zoom: {zoom}.")
+            response = await self.node_controller.get_clusters(bbox, zoom)
+            self.logger.info("::_get_clusters:: Successfully retrieved clusters.")
+            self.logger.debug("::_get_clusters:: Exiting _get_clusters.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_clusters:: Error in _get_clusters: {e}")
+
+    async def _get_tree(self):
+        """
+        Handles GET requests to retrieve one level of the Country -> ISP -> OS -> Client hierarchy. The optional
+        'path' argument selects the branch to expand, e.g. 'Germany/Hetzner/Linux'.
+
+        :return: The response from the NodeController's get_tree method.
+        """
+        path = tuple(part for part in request.args.get('path', '').split('/') if part)
+        if len(path) > len(TREE_LEVELS):
+            self.logger.warning(f"::_get_tree:: Path too deep: {path}")
+            abort(400, description=f"Path can have at most {len(TREE_LEVELS)} levels: {'/'.join(TREE_LEVELS)}")
+        try:
+            self.logger.debug(f"::_get_tree:: Handling request to get tree for path: {path}.")
+            for level, value in zip(TREE_LEVELS, path):
+                if not await self.node_controller.is_known_value(STATISTICS_DIMENSIONS[level], value):
+                    self.logger.warning(f"::_get_tree:: Unknown {level} in path: {value}")
+                    abort(404, description=f"Unknown {level}: {value}")
+            response = await self.node_controller.get_tree(path, request.headers)
+            self.logger.info(f"::_get_tree:: Successfully retrieved tree for path: {path}.")
+            self.logger.debug("::_get_tree:: Exiting _get_tree.")
+            return response
+        except HTTPException:
+            raise
+        except Exception as e:
+            self.logger.exception(f"::_get_tree:: Error in _get_tree: {e}")
+
     async def _get_summary_counts(self):
         """
-        Handles GET requests to retrieve summary counts for countries, nodes, and ISPs.
+        Handles GET requests to retrieve summary counts. The optional 'metrics' argument is a comma-separated
+        list of metric names; without it the counts for countries, nodes, and ISPs are returned.
 
         :return: The response from the NodeController's get_summary_counts method.
         """
+        metrics = [metric.strip() for metric in request.args.get('metrics', '').split(',') if metric.strip()]
+        unknown = [metric for metric in metrics if metric not in SUMMARY_METRICS]
+        if unknown:
+            self.logger.warning(f"::_get_summary_counts:: Unknown metrics requested: {unknown}")
+            abort(400, description=f"Unknown metrics: {', '.join(unknown)}. Available: {', '.join(SUMMARY_METRICS)}")
         try:
             self.logger.debug("::_get_summary_counts:: Handling request to get summary counts.")
-            response = await self.node_controller.get_summary_counts()
+            response = await self.node_controller.get_summary_counts(
+                request.headers, tuple(dict.fromkeys(metrics)) or DEFAULT_SUMMARY_METRICS)
             self.logger.info("::_get_summary_counts:: Successfully retrieved summary counts.")
             self.logger.debug("::_get_summary_counts:: Exiting _get_summary_counts.")
             return response
@@ -220,8 +427,11 @@ class NodeRouter:
         """
         Handles GET requests to retrieve nodes based on filters.
 
-        :return: The response from the NodeController's get_filter_nodes method.
+        Supports the same 'limit', 'after' and streaming options as the /nodes route.
+
+        :return: The response from the NodeController's get_filter_nodes, get_node_page or stream_nodes method.
         """
+        after, limit, stream = self._get_listing_options()
         try:
             country = request.args.get('country') or None
             os_type = request.args.get('os') or None
@@ -229,7 +439,13 @@ class NodeRouter:
             isp = request.args.get('isp') or None
             self.logger.debug(
                 f"::_get_filtered_nodes:: Handling request to get filtered nodes with filters: country={country}, os={os_type}, client={client}, isp={isp}.")
-            response = await self.node_controller.get_filtered_nodes(country, os_type, client, isp)
+            filters = {"country": country, "os": os_type, "client": client, "isp": isp}
+            if stream:
+                response = await self.node_controller.stream_nodes(after, limit, filters)
+            elif limit is not None or after is not None:
+                response = await self.node_controller.get_node_page(after, limit, filters)
+            else:
+                response = await self.node_controller.get_filtered_nodes(country, os_type, client, isp, request.headers)
             self.logger.info("::_get_filtered_nodes:: Successfully retrieved filtered nodes.")
             self.logger.debug("::_get_filtered_nodes:: Exiting _get_filtered_nodes.")
             return response
@@ -243,14 +459,48 @@ class NodeRouter:
         :param data_type: The type of data for which statistics are requested.
         :return: The response from the NodeController's get_statistics method.
         """
-        if data_type not in ['os', 'client', 'country', 'isp']:
+        if data_type not in STATISTICS_DIMENSIONS:
             self.logger.warning(f"::_get_statistics:: Invalid data type requested: {data_type}")
             abort(400, description='Invalid data type requested')
+        by = request.args.get('by') or None
+        if by is not None and (by not in STATISTICS_DIMENSIONS or by == data_type):
+            self.logger.warning(f"::_get_statistics:: Invalid breakdown type requested: {by}")
+            abort(400, description='Invalid breakdown type requested')
         try:
             self.logger.debug(f"::_get_statistics:: Handling request to get statistics for data type: {data_type}.")
-            response = await self.node_controller.get_statistics(data_type)
+            response = await self.node_controller.get_statistics(data_type, request.headers, by)
             self.logger.info(f"::_get_statistics:: Successfully retrieved statistics for data type: {data_type}.")
             self.logger.debug("::_get_statistics:: Exiting _get_statistics.")
             return response
         except Exception as e:
             self.logger.exception(f"::_get_statistics:: Error in _get_statistics for data type {data_type}: {e}")
+
+    async def _get_readiness(self):
+        """
+        Handles GET requests to check whether the caches are warm.
+
+        :return: The response from the NodeController's get_readiness method.
+        """
+        try:
+            self.logger.debug("::_get_readiness:: Handling readiness request.")
+            response = await self.node_controller.get_readiness()
+            self.logger.debug("::_get_readiness:: Exiting _get_readiness.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_readiness:: Error in _get_readiness: {e}")
+
+    async def _get_query_stats(self):
+        """
+        Handles GET requests to list the slowest database queries. The optional 'limit' argument caps the
+        number of queries returned.
+
+        :return: The response from the NodeController's get_query_stats method.
+        """
+        limit = self._get_positive_limit()
+        try:
+            self.logger.debug("::_get_query_stats:: Handling query stats request.")
+            response = await self.node_controller.get_query_stats(limit)
+            self.logger.debug("::_get_query_stats:: Exiting _get_query_stats.")
+            return response
+        except Exception as e:
+            self.logger.exception(f"::_get_query_stats:: Error in _get_query_stats: {e}")
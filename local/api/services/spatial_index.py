@@ -0,0 +1,157 @@
+import math
+from array import array
+
+WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """
+    Great-circle distance between two points in kilometers.
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over a set of points. Each occupied cell keeps the indexes of its points,
+    so a bounding-box query only visits the cells overlapping the box and checks exact coordinates in the
+    cells on its border.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_size=1.0):
+        """
+        :param latitudes: Point latitudes; NaN marks a point without coordinates, which is not indexed.
+        :param longitudes: Point longitudes, in the same order.
+        :param cell_size: Cell edge length in degrees.
+        """
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.cell_size = cell_size
+        self.cells = {}
+        for index, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+            if math.isnan(latitude) or math.isnan(longitude):
+                continue
+            self.cells.setdefault(self._cell(latitude, longitude), array('I')).append(index)
+
+    def __len__(self):
+        return sum(len(indexes) for indexes in self.cells.values())
+
+    def _cell(self, latitude, longitude):
+        return math.floor(longitude / self.cell_size), math.floor(latitude / self.cell_size)
+
+    def within(self, west, south, east, north):
+        """
+        Returns the indexes of the points inside a bounding box. A box whose west edge is east of its east edge
+        crosses the antimeridian.
+
+        :return: A list of point indexes in ascending order.
+        """
+        south, north = max(south, -90.0), min(north, 90.0)
+        if west > east:
+            spans = [(west, 180.0), (-180.0, east)]
+        else:
+            spans = [(max(west, -180.0), min(east, 180.0))]
+        found = []
+        for span_west, span_east in spans:
+            found.extend(self._within_span(span_west, south, span_east, north))
+        found.sort()
+        return found
+
+    def near(self, latitude, longitude, radius_km):
+        """
+        Returns the points within a great-circle radius of a location, nearest first. Candidates come from the
+        bounding box of the circle and are then checked with the haversine distance.
+
+        :param latitude: Latitude of the center in degrees.
+        :param longitude: Longitude of the center in degrees.
+        :param radius_km: The radius in kilometers.
+        :return: A list of (distance in km, point index) tuples sorted by distance.
+        """
+        angular = radius_km / EARTH_RADIUS_KM
+        lat_delta = math.degrees(angular)
+        south, north = latitude - lat_delta, latitude + lat_delta
+        if south <= -90.0 or north >= 90.0 or math.sin(angular) >= math.cos(math.radians(latitude)):
+            west, east = -180.0, 180.0
+        else:
+            lon_delta = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(latitude))))
+            west, east = longitude - lon_delta, longitude + lon_delta
+            if west < -180.0:
+                west += 360.0
+            if east > 180.0:
+                east -= 360.0
+        found = []
+        for index in self.within(west, south, east, north):
+            distance = haversine_km(latitude, longitude, self.latitudes[index], self.longitudes[index])
+            if distance <= radius_km:
+                found.append((distance, index))
+        found.sort()
+        return found
+
+    def _within_span(self, west, south, east, north):
+        min_x, min_y = self._cell(south, west)
+        max_x, max_y = self._cell(north, east)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.cells):
+            cells = [(cell, indexes) for cell, indexes in self.cells.items()
+                     if min_x <= cell[0] <= max_x and min_y <= cell[1] <= max_y]
+        else:
+            cells = [((x, y), self.cells[(x, y)]) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+                     if (x, y) in self.cells]
+        latitudes = self.latitudes
+        longitudes = self.longitudes
+        for (x, y), indexes in cells:
+            if min_x < x < max_x and min_y < y < max_y:
+                yield from indexes
+            else:
+                for index in indexes:
+                    if west <= longitudes[index] <= east and south <= latitudes[index] <= north:
+                        yield index
+
+
+def cluster_cell_size(zoom):
+    """
+    Grid cell size in degrees used to cluster points at a web map zoom level, about 64 pixels of a 256 pixel
+    tile.
+
+    :param zoom: The map zoom level.
+    :return: The cell edge length in degrees.
+    """
+    return 360.0 / (2 ** zoom) / 4
+
+
+class ClusterLayer:
+    """
+    Grid clusters of a point set at one zoom level. Every cluster carries the centroid and the number of its
+    points; clusters are themselves indexed, so a viewport query costs the clusters it shows.
+    """
+
+    def __init__(self, latitudes, longitudes, zoom):
+        self.zoom = zoom
+        cells = GridIndex(latitudes, longitudes, cluster_cell_size(zoom)).cells
+        self.counts = array('I')
+        self.members = array('i')
+        centroid_latitudes = array('d')
+        centroid_longitudes = array('d')
+        for indexes in cells.values():
+            count = len(indexes)
+            self.counts.append(count)
+            self.members.append(indexes[0] if count == 1 else -1)
+            centroid_latitudes.append(sum(latitudes[index] for index in indexes) / count)
+            centroid_longitudes.append(sum(longitudes[index] for index in indexes) / count)
+        self.index = GridIndex(centroid_latitudes, centroid_longitudes, max(cluster_cell_size(zoom), 1.0))
+
+    def within(self, west, south, east, north):
+        """
+        Returns the clusters whose centroid lies inside a bounding box.
+
+        :return: A list of (latitude, longitude, count, point index or None for multi-point clusters) tuples.
+        """
+        return [
+            (self.index.latitudes[cluster], self.index.longitudes[cluster], self.counts[cluster],
+             self.members[cluster] if self.members[cluster] >= 0 else None)
+            for cluster in self.index.within(west, south, east, north)
+        ]
@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+
+
+class SingleFlightCache:
+    """
+    In-memory result cache that lets concurrent misses for the same key share one computation and serves
+    expired results for a grace period while a single background refresh replaces them.
+    """
+
+    def __init__(self, ttl, stale_ttl=0):
+        """
+        :param ttl: Seconds a result is fresh.
+        :param stale_ttl: Seconds after expiry during which the old result is still served while it is refreshed.
+        """
+        self.logger = logging.getLogger('quart_app.utils.single_flight')
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._inflight = {}
+
+    def expires_in(self, key):
+        """
+        Seconds until the cached result for a key expires.
+
+        :param key: The cache key.
+        :return: The remaining freshness in seconds, or None if nothing is cached.
+        """
+        entry = self._entries.get(key)
+        return None if entry is None else self.ttl - (time.monotonic() - entry[1])
+
+    def invalidate(self, key=None):
+        """
+        Drops the cached result for a key, or every cached result.
+
+        :param key: The cache key (optional).
+        """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get(self, key, compute):
+        """
+        Returns the cached result for a key, computing it at most once at a time.
+
+        :param key: The cache key.
+        :param compute: Zero-argument coroutine function producing the result.
+        :return: The cached or freshly computed result.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age <= self.ttl:
+                return value
+            if age <= self.ttl + self.stale_ttl:
+                self.logger.debug(f"::get:: Serving stale result for {key} while refreshing.")
+                self.refresh(key, compute)
+                return value
+        return await asyncio.shield(self.refresh(key, compute))
+
+    def refresh(self, key, compute):
+        """
+        Starts computing a key unless a computation for it is already in flight.
+
+        The computation runs in an empty context, so it never shares a request-bound database session with
+        the request that happened to trigger it.
+
+        :param key: The cache key.
+        :param compute: Zero-argument coroutine function producing the result.
+        :return: The in-flight task.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = contextvars.Context().run(asyncio.ensure_future, self._compute(key, compute))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[key] = task
+        return task
+
+    async def _compute(self, key, compute):
+        try:
+            value = await compute()
+            self._entries[key] = (value, time.monotonic())
+            return value
+        except Exception as e:
+            self.logger.exception(f"::_compute:: Error while computing {key}: {e}")
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+def single_flight(ttl, stale_ttl=0, key=None):
+    """
+    Decorates a coroutine method with a SingleFlightCache, as a drop-in for aiocache's @cached.
+
+    :param ttl: Seconds a result is fresh.
+    :param stale_ttl: Seconds an expired result is still served while it is refreshed.
+    :param key: The cache key; defaults to the method name and its arguments.
+    :return: The decorator.
+    """
+    def decorator(method):
+        cache = SingleFlightCache(ttl, stale_ttl)
+
+        def cache_key(args):
+            return key or (method.__name__, args)
+
+        @functools.wraps(method)
+        async def wrapper(self, *args):
+            return await cache.get(cache_key(args), lambda: method(self, *args))
+
+        def refresh(self, *args):
+            return cache.refresh(cache_key(args), lambda: method(self, *args))
+
+        def expires_in(*args):
+            return cache.expires_in(cache_key(args))
+
+        wrapper.cache = cache
+        wrapper.refresh = refresh
+        wrapper.expires_in = expires_in
+        return wrapper
+
+    return decorator
@@ -5,9 +5,11 @@ from concurrent.futures import ThreadPoolExecutor
 import requests
 from bs4 import BeautifulSoup
 from neo4j import GraphDatabase
-from datetime import datetime
 import subprocess
 from dotenv import load_dotenv
+from node_writer import NodeWriter, make_node_row, bump_data_version
+from geo_resolver import GeoResolver
+from neo4j_schema import ensure_schema
 
 load_dotenv()
 
@@ -39,85 +41,43 @@ def check_port(host, port, timeout=3):
         return False
 
 
-def add_node(tx, node_id, host, port, client, os, status, latitude=None, longitude=None, isp=None, country_name=None):
-    query = (
-        "CREATE (n:Node {id: $node_id, host: $host, port: $port, "
-        "client: $client, os: $os, status: $status, latitude: $latitude, "
-        "longitude: $longitude, isp: $isp, country_name: $country_name, created_at: $created_at})"
-    )
-    created_at = datetime.now().isoformat()
-    tx.run(query, node_id=node_id, host=host, port=port, client=client, os=os, status=status,
-           latitude=latitude, longitude=longitude, isp=isp, country_name=country_name, created_at=created_at)
-
-
-def update_node_status(tx, node_id, status):
-    query = (
-        "MATCH (n:Node {id: $node_id}) "
-        "SET n.status = $status, n.updated_at = $updated_at"
-    )
-    updated_at = datetime.now().isoformat()
-    tx.run(query, node_id=node_id, status=status, updated_at=updated_at)
-
-
-def fetch_geo_info(ip):
-    url = f"https://api.ipgeolocation.io/ipgeo?apiKey={API_KEY}&ip={ip}"
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            geo_info = {
-                "latitude": data.get("latitude", ""),
-                "longitude": data.get("longitude", ""),
-                "isp": data.get("isp", ""),
-                "country_name": data.get("country_name", "")
-            }
-            print(f"{ip} için coğrafi bilgi alındı: {geo_info}")
-            return geo_info
-        else:
-            raise ValueError(f"API yanıtı uygun değil, durum kodu: {response.status_code}")
-    except Exception as e:
-        print(f"{ip} için coğrafi bilgi alınırken hata oluştu: {e}")
-        return None
-
-
-def check_and_update(node):
+def check_and_update(node, resolver, writer):
     node_id, host, port, client, os = node.values()
     status = 0 if check_port(host, port) else 1
-    geo_info = fetch_geo_info(host) if status == 0 else None
-
-    with driver.session() as session:
-        if not session.execute_read(node_exists, node_id):
-            session.execute_write(add_node, node_id, host, port, client, os, status,
-                                  geo_info['latitude'] if geo_info else None,
-                                  geo_info['longitude'] if geo_info else None,
-                                  geo_info['isp'] if geo_info else None,
-                                  geo_info['country_name'] if geo_info else None)
-            print(f"{host}:{port} adresindeki {node_id} düğümü eklendi.")
-        else:
-            session.execute_write(update_node_status, node_id, status)
-            print(f"{host}:{port} adresindeki {node_id} düğümü güncellendi.")
+    geo_info = resolver.resolve(host) if status == 0 else None
+    writer.add(make_node_row(node_id, host, port, client, os, status, geo_info))
+    print(f"{host}:{port} adresindeki {node_id} düğümü yazma kuyruğuna eklendi.")
 
 
-def node_exists(tx, node_id):
-    query = "MATCH (n:Node {id: $node_id}) RETURN n"
-    result = tx.run(query, node_id=node_id)
-    return result.single() is not None
+def delete_nodes_with_empty_lat_lon_tx(tx):
+    query = """
+    MATCH (n:Node)
+    WHERE n.latitude IS NULL OR n.longitude IS NULL
+    DETACH DELETE n
+    """
+    deleted = tx.run(query).consume().counters.nodes_deleted
+    if deleted:
+        bump_data_version(tx)
+        bump_data_version(tx, 'relationships')
+    return deleted
 
 
 def delete_nodes_with_empty_lat_lon():
     with driver.session() as session:
-        query = """
-        MATCH (n:Node)
-        WHERE n.latitude IS NULL OR n.longitude IS NULL
-        DETACH DELETE n
-        """
-        session.run(query)
-        print("Latitude veya Longitude değeri boş olan düğümler silindi.")
+        deleted = session.execute_write(delete_nodes_with_empty_lat_lon_tx)
+        print(f"Latitude veya Longitude değeri boş olan {deleted} düğüm silindi.")
+
+
+def delete_all_relationships_tx(tx):
+    deleted = tx.run("MATCH ()-[r]->() DELETE r").consume().counters.relationships_deleted
+    if deleted:
+        bump_data_version(tx, 'relationships')
+    return deleted
 
 
 def delete_all_relationships():
     with driver.session() as session:
-        session.run("MATCH ()-[r]->() DELETE r")
+        session.execute_write(delete_all_relationships_tx)
 
 
 def import_relationships():
@@ -160,14 +120,19 @@ async def scrape_and_check_nodes(executor):
 
         loop = asyncio.get_running_loop()
         tasks = []
-        for node in nodes:
-            task = loop.run_in_executor(executor, check_and_update, node)
-            tasks.append(task)
+        with GeoResolver(API_KEY) as resolver, NodeWriter(driver) as writer:
+            resolver.prefetch(node['host'] for node in nodes)
+            for node in nodes:
+                task = loop.run_in_executor(executor, check_and_update, node, resolver, writer)
+                tasks.append(task)
 
-        await asyncio.gather(*tasks)
+            await asyncio.gather(*tasks)
+        print(f"{writer.written} düğüm eklendi veya güncellendi.")
 
 
 async def main():
+    with driver.session() as session:
+        ensure_schema(session)
     executor = ThreadPoolExecutor()
     await scrape_and_check_nodes(executor)
 
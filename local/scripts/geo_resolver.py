@@ -0,0 +1,192 @@
+import os
+import asyncio
+import sqlite3
+import threading
+import time
+import requests
+from geo_ranges import IpRangeDatabase
+
+GEO_API_URL = "https://api.ipgeolocation.io/ipgeo"
+GEO_FIELDS = ("latitude", "longitude", "isp", "country_name")
+NEGATIVE_STATUS_CODES = (400, 404, 423)
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geo_cache.sqlite3")
+
+
+class GeoCache:
+    """
+    On-disk IP -> geolocation cache backed by SQLite. Successful lookups live for ttl seconds; IPs the API
+    rejected (private, bogon or malformed addresses) are remembered as misses for negative_ttl seconds.
+    """
+
+    def __init__(self, path=None, ttl=None, negative_ttl=None):
+        self.path = path or os.getenv('GEO_CACHE_PATH') or DEFAULT_CACHE_PATH
+        self.ttl = ttl or float(os.getenv('GEO_CACHE_TTL', str(30 * 24 * 3600)))
+        self.negative_ttl = negative_ttl or float(os.getenv('GEO_CACHE_NEGATIVE_TTL', str(24 * 3600)))
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS geo ("
+                "ip TEXT PRIMARY KEY, latitude TEXT, longitude TEXT, isp TEXT, country_name TEXT, "
+                "found INTEGER NOT NULL, fetched_at REAL NOT NULL)"
+            )
+
+    def get_many(self, ips):
+        ips = list(dict.fromkeys(ips))
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(ips), 500):
+                chunk = ips[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT ip, latitude, longitude, isp, country_name, found, fetched_at FROM geo "
+                    f"WHERE ip IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for ip, latitude, longitude, isp, country_name, hit, fetched_at in rows:
+                    if now - fetched_at > (self.ttl if hit else self.negative_ttl):
+                        continue
+                    found[ip] = dict(zip(GEO_FIELDS, (latitude, longitude, isp, country_name))) if hit else None
+        return found
+
+    def put_many(self, results):
+        now = time.time()
+        rows = [
+            (ip, *((geo_info or {}).get(field) for field in GEO_FIELDS), 1 if geo_info else 0, now)
+            for ip, geo_info in results.items()
+        ]
+        if not rows:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO geo VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class GeoResolver:
+    """
+    Resolves IPs through the offline IpRangeDatabase (when GEO_RANGES_PATH is set), then the GeoCache, and
+    calls the ipgeolocation API only for hosts neither of them knows. New API results are kept in memory and
+    written to the cache in one batch by flush() (or when the resolver is closed).
+
+    resolve_async keeps SQLite off the event loop and lets concurrent lookups of the same IP await the first
+    one instead of each calling the API.
+    """
+
+    def __init__(self, api_key, cache=None, ranges=None):
+        self.api_key = api_key
+        self.cache = cache or GeoCache()
+        self.ranges = ranges if ranges is not None else IpRangeDatabase.from_env()
+        self.offline_hits = 0
+        self.api_calls = 0
+        self._known = {}
+        self._pending = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.to_thread(self.close)
+
+    def prefetch(self, ips):
+        cached = self.cache.get_many(ip for ip in ips if ip not in self._known and not self._offline(ip))
+        with self._lock:
+            self._known.update(cached)
+        return cached
+
+    def _offline(self, ip):
+        return self.ranges is not None and self.ranges.lookup(ip) is not None
+
+    def _lookup(self, ip):
+        with self._lock:
+            if ip in self._known:
+                return True, self._known[ip]
+        if self.ranges is not None:
+            geo_info = self.ranges.lookup(ip)
+            if geo_info is not None:
+                with self._lock:
+                    self.offline_hits += 1
+                return True, geo_info
+        cached = self.cache.get_many([ip])
+        if ip in cached:
+            with self._lock:
+                self._known[ip] = cached[ip]
+            return True, cached[ip]
+        return False, None
+
+    def _remember(self, ip, geo_info, cacheable=True):
+        with self._lock:
+            self._known[ip] = geo_info
+            self.api_calls += 1
+            if cacheable:
+                self._pending[ip] = geo_info
+
+    def _parse(self, ip, data):
+        geo_info = {field: data.get(field) for field in GEO_FIELDS}
+        print(f"Geolocation information retrieved for {ip}: {geo_info}")
+        return geo_info
+
+    def resolve(self, ip):
+        known, geo_info = self._lookup(ip)
+        if known:
+            return geo_info
+        try:
+            response = self._session.get(GEO_API_URL, params={"apiKey": self.api_key, "ip": ip}, timeout=10)
+            if response.status_code == 200:
+                geo_info = self._parse(ip, response.json())
+                self._remember(ip, geo_info)
+                return geo_info
+            print(f"Invalid API response for {ip}, status code: {response.status_code}")
+            self._remember(ip, None, cacheable=response.status_code in NEGATIVE_STATUS_CODES)
+        except Exception as e:
+            print(f"Error retrieving geolocation information for {ip}: {e}")
+        return None
+
+    async def resolve_async(self, http, ip):
+        if ip in self._known:
+            return self._known[ip]
+        task = self._inflight.get(ip)
+        if task is None:
+            task = asyncio.ensure_future(self._resolve_async(http, ip))
+            task.add_done_callback(lambda done: self._inflight.pop(ip, None))
+            self._inflight[ip] = task
+        return await asyncio.shield(task)
+
+    async def _resolve_async(self, http, ip):
+        known, geo_info = await asyncio.to_thread(self._lookup, ip)
+        if known:
+            return geo_info
+        try:
+            async with http.get(GEO_API_URL, params={"apiKey": self.api_key, "ip": ip}) as response:
+                if response.status == 200:
+                    geo_info = self._parse(ip, await response.json(content_type=None))
+                    self._remember(ip, geo_info)
+                    return geo_info
+                print(f"Invalid API response for {ip}, status code: {response.status}")
+                self._remember(ip, None, cacheable=response.status in NEGATIVE_STATUS_CODES)
+        except Exception as e:
+            print(f"Error retrieving geolocation information for {ip}: {e}")
+        return None
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self.cache.put_many(pending)
+        if pending:
+            print(f"{len(pending)} geolocation results stored in the cache.")
+
+    def close(self):
+        self.flush()
+        self._session.close()
+        self.cache.close()
+        print(f"Geolocation offline hits: {self.offline_hits}, API calls made: {self.api_calls}.")
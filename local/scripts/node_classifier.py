@@ -0,0 +1,79 @@
+import re
+
+# Each dimension maps to (property, default category, rules). A rule is (category, alternatives) where every
+# alternative is a tuple of keywords that must all occur in the lowercased value; the first matching rule wins.
+CLASSIFICATION_RULES = {
+    "isp": ("isp_category", "Other ISPs", [
+        ("Contabo", [("contabo",)]),
+        ("AWS", [("aws",), ("amazon",)]),
+        ("Azure", [("azure",), ("microsoft",)]),
+        ("Google", [("google",)]),
+        ("Alibaba", [("alibaba",)]),
+        ("Oracle", [("oracle",)]),
+        ("IBM", [("ibm",)]),
+        ("Tencent", [("tencent",)]),
+        ("OVHCloud", [("ovh",)]),
+        ("DigitalOcean", [("digitalocean",)]),
+        ("Linode", [("linode",), ("akamai",)]),
+        ("Salesforce", [("salesforce",)]),
+        ("Huawei", [("huawei", "cloud")]),
+        ("Dell", [("dell", "cloud")]),
+        ("Vultr", [("vultr",)]),
+        ("Heroku", [("heroku",)]),
+        ("Hetzner", [("hetzner",)]),
+        ("Scaleway", [("scaleway",)]),
+        ("Upcloud", [("upcloud",)]),
+        ("Kamatera", [("kamatera",)]),
+    ]),
+    "os": ("os_category", "Other OSs", [
+        ("Linux", [("linux",)]),
+        ("Windows", [("windows",)]),
+        ("MacOS", [("macos",)]),
+    ]),
+    "client": ("client_category", "Other Clients", [
+        ("Geth", [("geth",)]),
+        ("Nethermind", [("nethermind",)]),
+        ("Besu", [("besu",)]),
+        ("Erigon", [("erigon",)]),
+        ("Reth", [("reth",)]),
+        ("EthereumJS", [("ethereumjs",)]),
+    ]),
+}
+
+
+class Classifier:
+    """
+    Assigns the canonical category of one dimension. All keywords of the rule table are compiled into a single
+    regex of overlapping lookaheads, so one scan of the value finds every keyword it contains; the rules are
+    then checked in table order against that keyword set.
+    """
+
+    def __init__(self, prop, default, rules):
+        self.prop = prop
+        self.default = default
+        self.rules = [(category, [frozenset(keywords) for keywords in alternatives])
+                      for category, alternatives in rules]
+        keywords = sorted({keyword for _, alternatives in rules for group in alternatives for keyword in group},
+                          key=len, reverse=True)
+        self._matcher = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in keywords) + "))")
+        self._memo = {}
+
+    def classify(self, value):
+        if not value:
+            return self.default
+        category = self._memo.get(value)
+        if category is None:
+            found = set(self._matcher.findall(value.lower()))
+            category = next((category for category, alternatives in self.rules
+                             if any(group <= found for group in alternatives)), self.default)
+            self._memo[value] = category
+        return category
+
+
+CLASSIFIERS = {dimension: Classifier(*definition) for dimension, definition in CLASSIFICATION_RULES.items()}
+CATEGORY_PROPERTIES = tuple(classifier.prop for classifier in CLASSIFIERS.values())
+
+
+def classify_node(client=None, os=None, isp=None):
+    values = {"client": client, "os": os, "isp": isp}
+    return {classifier.prop: classifier.classify(values[dimension]) for dimension, classifier in CLASSIFIERS.items()}
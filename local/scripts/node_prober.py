@@ -0,0 +1,54 @@
+import os
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+
+async def check_port(host, port, timeout=3):
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+    except (asyncio.TimeoutError, ConnectionError):
+        return False
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Socket error for {host}:{port} - {e}")
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+class NodeProber:
+    """
+    Asynchronous TCP liveness prober. At most `concurrency` connections are open at once, probes to the same
+    host are spaced by at least `host_interval` seconds, and each timeout is jittered by +/- `jitter` so that
+    a wave of unreachable hosts does not time out in lockstep.
+    """
+
+    def __init__(self, concurrency=None, timeout=None, jitter=None, host_interval=None):
+        self.concurrency = concurrency or int(os.getenv('PROBE_CONCURRENCY', '500'))
+        self.timeout = timeout or float(os.getenv('PROBE_TIMEOUT', '3'))
+        self.jitter = jitter if jitter is not None else float(os.getenv('PROBE_JITTER', '0.2'))
+        self.host_interval = host_interval if host_interval is not None else float(os.getenv('PROBE_HOST_INTERVAL', '0.5'))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._host_locks = defaultdict(asyncio.Lock)
+        self._host_last_probe = {}
+
+    def _jittered_timeout(self):
+        return self.timeout * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def probe(self, host, port):
+        async with self._host_locks[host]:
+            wait = self._host_last_probe.get(host, float('-inf')) + self.host_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._semaphore:
+                online = await check_port(host, port, self._jittered_timeout())
+            self._host_last_probe[host] = time.monotonic()
+            return online
+
+    async def probe_many(self, targets):
+        return await asyncio.gather(*(self.probe(host, port) for host, port in targets))
@@ -0,0 +1,38 @@
+import pytest
+from api.services.node_snapshot import NodeSnapshot
+
+
+def node(node_id, country, isp, os, client, latitude=None, longitude=None, status=0):
+    return {
+        "NodeId": node_id, "Host": f"10.0.0.{node_id}", "Port": 30303, "Status": status,
+        "Latitude": latitude, "Longitude": longitude, "CreatedAt": None,
+        "Country": country, "ISP": isp, "OS": os, "Client": client,
+        "ISPType": isp, "OSType": os, "ClientType": client,
+    }
+
+
+def ids(snapshot, rows):
+    return [snapshot.ids[row] for row in rows]
+
+
+@pytest.fixture
+def make_snapshot():
+    def build(records):
+        snapshot = NodeSnapshot(1)
+        for record in records:
+            snapshot.append(record)
+        return snapshot.freeze()
+    return build
+
+
+@pytest.fixture
+def snapshot(make_snapshot):
+    return make_snapshot([
+        node("01", "Germany", "Hetzner", "Linux", "Geth"),
+        node("02", "Germany", "AWS", "Linux", "Nethermind"),
+        node("03", "United States", "AWS", "Windows", "Geth"),
+        node("04", "GERMANY", "Hetzner", "Linux", "Geth"),
+        node("05", "France", "OVHCloud", "Linux", "Besu"),
+        node("06", "Germany", "Hetzner", "Windows", "Geth"),
+        node("07", "United States", "AWS", "Linux", "Geth"),
+    ])
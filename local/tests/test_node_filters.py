@@ -0,0 +1,37 @@
+from tests.conftest import ids
+
+
+def test_filter_matches_case_insensitively(snapshot):
+    assert ids(snapshot, snapshot.filter(country="germany")) == ["01", "02", "04", "06"]
+    assert ids(snapshot, snapshot.filter(country="GeRmAnY")) == ["01", "02", "04", "06"]
+
+
+def test_filter_intersects_every_criterion(snapshot):
+    rows = snapshot.filter(country="germany", isp="hetzner", os="linux")
+    assert ids(snapshot, rows) == ["01", "04"]
+    assert ids(snapshot, snapshot.filter(isp="aws", client="geth")) == ["03", "07"]
+
+
+def test_filter_result_is_ascending_whatever_the_posting_sizes(snapshot):
+    rows = snapshot.filter(client="geth", country="united states")
+    assert rows == sorted(rows)
+    assert ids(snapshot, rows) == ["03", "07"]
+
+
+def test_filter_without_criteria_returns_every_row(snapshot):
+    assert snapshot.filter() == list(range(len(snapshot)))
+    assert snapshot.filter(country=None, os=None) == list(range(len(snapshot)))
+
+
+def test_filter_with_unknown_or_disjoint_values_is_empty(snapshot):
+    assert snapshot.filter(country="atlantis") == []
+    assert snapshot.filter(country="france", isp="aws") == []
+
+
+def test_filter_matches_brute_force_for_every_country_and_client(snapshot):
+    for country in {"germany", "france", "united states"}:
+        for client in {"geth", "nethermind", "besu"}:
+            expected = [row for row in range(len(snapshot))
+                        if snapshot.value("country", row).lower() == country
+                        and snapshot.value("client", row).lower() == client]
+            assert snapshot.filter(country=country, client=client) == expected
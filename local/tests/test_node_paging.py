@@ -0,0 +1,32 @@
+from tests.conftest import ids
+
+
+def test_page_over_filtered_rows(snapshot):
+    rows = snapshot.filter(country="germany")
+    page, cursor = snapshot.page(rows, limit=2)
+    assert ids(snapshot, page) == ["01", "02"] and cursor == "02"
+    page, cursor = snapshot.page(rows, after=cursor, limit=2)
+    assert ids(snapshot, page) == ["04", "06"] and cursor is None
+
+
+def test_page_walks_all_rows_with_cursors(snapshot):
+    rows = list(range(len(snapshot)))
+    seen, cursor = [], None
+    while True:
+        page, cursor = snapshot.page(rows, after=cursor, limit=3)
+        seen.extend(ids(snapshot, page))
+        if cursor is None:
+            break
+        assert cursor == seen[-1]
+    assert seen == ["01", "02", "03", "04", "05", "06", "07"]
+
+
+def test_page_cursor_between_ids_resumes_after_it(snapshot):
+    rows = snapshot.filter(country="germany")
+    page, cursor = snapshot.page(rows, after="03")
+    assert ids(snapshot, page) == ["04", "06"] and cursor is None
+
+
+def test_page_after_last_id_is_empty(snapshot):
+    page, cursor = snapshot.page(list(range(len(snapshot))), after="99", limit=5)
+    assert page == [] and cursor is None
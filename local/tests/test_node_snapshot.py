@@ -0,0 +1,30 @@
+from api.services.node_snapshot import NodeSnapshot
+from tests.conftest import ids, node
+
+
+def test_freeze_sorts_rows_by_string_id_whatever_the_load_order(make_snapshot):
+    snapshot = make_snapshot([
+        node(9, "France", "OVHCloud", "Linux", "Besu"),
+        node("a", "Germany", "AWS", "Linux", "Geth"),
+        node(10, "Germany", "Hetzner", "Windows", "Geth"),
+        node("2", "United States", "AWS", "Linux", "Nethermind"),
+    ])
+    assert snapshot.ids == ["10", "2", "9", "a"]
+    assert [snapshot.record(row)["Country"] for row in range(len(snapshot))] == \
+        ["Germany", "United States", "France", "Germany"]
+    assert [snapshot.record(row)["Host"] for row in range(len(snapshot))] == \
+        ["10.0.0.10", "10.0.0.2", "10.0.0.9", "10.0.0.a"]
+    assert ids(snapshot, snapshot.filter(country="germany")) == ["10", "a"]
+    assert snapshot.counts("country") == {"Germany": 2, "United States": 1, "France": 1}
+
+
+def test_page_cursor_is_compared_as_a_string(make_snapshot):
+    snapshot = make_snapshot([node(node_id, "Germany", "AWS", "Linux", "Geth") for node_id in (3, 1, 2)])
+    page, cursor = snapshot.page(list(range(len(snapshot))), after=1, limit=1)
+    assert ids(snapshot, page) == ["2"] and cursor == "2"
+
+
+def test_empty_snapshot():
+    snapshot = NodeSnapshot().freeze()
+    assert snapshot.filter(country="germany") == []
+    assert snapshot.page([], limit=10) == ([], None)
@@ -0,0 +1,90 @@
+import asyncio
+import random
+from collections import Counter
+from itertools import permutations
+import pytest
+from api.services.node_service import NodeService, STATISTICS_DIMENSIONS
+from api.services.node_snapshot import NodeSnapshot, NodeSnapshotStore
+from tests.conftest import node
+
+COUNTRIES = ["Germany", "France", "United States", "Japan", None]
+ISPS = ["AWS", "Hetzner", "OVHCloud", "Other ISPs"]
+OSS = ["Linux", "Windows", "Other OSs"]
+CLIENTS = ["Geth", "Nethermind", "Besu", "Other Clients"]
+
+
+@pytest.fixture
+def records():
+    generator = random.Random(11)
+    return [node(f"{index:04d}", generator.choice(COUNTRIES), generator.choice(ISPS), generator.choice(OSS),
+                 generator.choice(CLIENTS)) for index in range(300)]
+
+
+@pytest.fixture
+def large_snapshot(make_snapshot, records):
+    return make_snapshot(records)
+
+
+def brute_counts(records, dimension):
+    return dict(Counter(record[NodeSnapshot.DIMENSIONS[dimension]] for record in records))
+
+
+def brute_cross_counts(records, first, second):
+    table = {}
+    for record in records:
+        row = table.setdefault(record[NodeSnapshot.DIMENSIONS[first]], {})
+        value = record[NodeSnapshot.DIMENSIONS[second]]
+        row[value] = row.get(value, 0) + 1
+    return table
+
+
+@pytest.mark.parametrize("dimension", NodeSnapshot.AGGREGATE_DIMENSIONS)
+def test_counts_match_brute_force(large_snapshot, records, dimension):
+    assert large_snapshot.counts(dimension) == brute_counts(records, dimension)
+    assert sum(large_snapshot.counts(dimension).values()) == len(records)
+
+
+@pytest.mark.parametrize("first, second", list(permutations(NodeSnapshot.AGGREGATE_DIMENSIONS, 2)))
+def test_cross_counts_match_brute_force(large_snapshot, records, first, second):
+    assert large_snapshot.cross_counts(first, second) == brute_cross_counts(records, first, second)
+
+
+def test_cross_counts_of_other_dimensions_are_computed_on_demand(large_snapshot, records):
+    assert large_snapshot.cross_counts("country", "client") == brute_cross_counts(records, "country", "client")
+
+
+@pytest.fixture
+def service(monkeypatch, large_snapshot):
+    monkeypatch.setenv("NEO4J_URI", "bolt://localhost:7687")
+    monkeypatch.setenv("NEO4J_USER", "neo4j")
+    monkeypatch.setenv("NEO4J_PASSWORD", "password")
+    service = NodeService()
+
+    async def load(version):
+        return large_snapshot
+
+    service.snapshots = NodeSnapshotStore(load)
+    return service
+
+
+@pytest.mark.parametrize("data_type", STATISTICS_DIMENSIONS)
+def test_statistics_match_brute_force(service, records, data_type):
+    statistics = asyncio.run(service.fetch_statistics(data_type))[data_type]
+    expected = brute_counts(records, STATISTICS_DIMENSIONS[data_type])
+    assert {item["type"]: item["count"] for item in statistics} == expected
+    for item in statistics:
+        assert item["percentage"] == pytest.approx(item["count"] * 100.0 / len(records))
+
+
+def test_statistics_breakdown_matches_brute_force(service, records):
+    statistics = asyncio.run(service.fetch_statistics("country", by="client"))["country"]
+    expected = brute_cross_counts(records, "country", "client_type")
+    assert [item["type"] for item in statistics] == sorted(expected, key=lambda value: (value is None, value or ""))
+    for item in statistics:
+        assert {entry["type"]: entry["count"] for entry in item["breakdown"]} == expected[item["type"]]
+        assert sum(entry["count"] for entry in item["breakdown"]) == item["count"]
+
+
+def test_statistics_reject_unknown_dimensions(service):
+    assert asyncio.run(service.fetch_statistics("planet")) == {"error": "Invalid data type requested"}
+    assert asyncio.run(service.fetch_statistics("os", by="os")) == {"error": "Invalid data type requested"}
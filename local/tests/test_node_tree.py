@@ -0,0 +1,33 @@
+from tests.conftest import ids
+
+
+def test_subtree_root_counts_countries(snapshot):
+    rows, children = snapshot.subtree(())
+    assert len(rows) == len(snapshot)
+    assert children == {"Germany": 3, "United States": 2, "GERMANY": 1, "France": 1}
+
+
+def test_subtree_expands_a_branch(snapshot):
+    rows, children = snapshot.subtree(("Germany",))
+    assert ids(snapshot, rows) == ["01", "02", "06"]
+    assert children == {"Hetzner": 2, "AWS": 1}
+    rows, children = snapshot.subtree(("Germany", "Hetzner"))
+    assert ids(snapshot, rows) == ["01", "06"]
+    assert children == {"Linux": 1, "Windows": 1}
+
+
+def test_subtree_children_sum_to_branch_size(snapshot):
+    for path in [(), ("United States",), ("United States", "AWS"), ("Germany", "Hetzner", "Linux")]:
+        rows, children = snapshot.subtree(path)
+        assert sum(children.values()) == len(rows)
+
+
+def test_subtree_full_path_lists_nodes_without_children(snapshot):
+    rows, children = snapshot.subtree(("United States", "AWS", "Linux", "Geth"))
+    assert ids(snapshot, rows) == ["07"]
+    assert children is None
+
+
+def test_subtree_unknown_value_is_empty(snapshot):
+    assert snapshot.subtree(("Germany", "Contabo")) == ([], {})
+    assert snapshot.subtree(("Atlantis",)) == ([], {})
@@ -0,0 +1,62 @@
+import asyncio
+from api.utils.payload_cache import EncodedPayload, PayloadCache
+
+
+def test_concurrent_misses_share_one_build():
+    cache = PayloadCache()
+    builds = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def build():
+            builds.append(1)
+            await release.wait()
+            return EncodedPayload([1, 2, 3], 1)
+
+        waiters = [asyncio.ensure_future(cache.get_or_build("nodes", 1, build)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*waiters)
+
+    payloads = asyncio.run(scenario())
+    assert len(builds) == 1
+    assert all(payload is payloads[0] for payload in payloads)
+    assert cache.get("nodes", 1) is payloads[0]
+
+
+def test_failed_build_is_not_cached():
+    cache = PayloadCache()
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        try:
+            await cache.get_or_build("nodes", 1, failing)
+        except RuntimeError:
+            pass
+        return await cache.get_or_build("nodes", 1, lambda: asyncio.sleep(0, EncodedPayload([], 1)))
+
+    assert asyncio.run(scenario()).empty
+    assert len(cache) == 1
+
+
+def test_new_version_evicts_older_payloads():
+    cache = PayloadCache()
+    cache.put("a", EncodedPayload(["a"], 1))
+    cache.put("b", EncodedPayload(["b"], 1))
+    cache.put("a", EncodedPayload(["a"], 2))
+    assert len(cache) == 1
+    assert cache.get("a", 1) is None and cache.get("a", 2) is not None
+
+
+def test_least_recently_used_payloads_are_evicted_beyond_the_cap():
+    cache = PayloadCache(max_entries=3)
+    for key in "abc":
+        cache.put(key, EncodedPayload([key], 1))
+    cache.get("a", 1)
+    cache.put("d", EncodedPayload(["d"], 1))
+    assert len(cache) == 3
+    assert cache.get("b", 1) is None
+    assert all(cache.get(key, 1) is not None for key in "acd")
@@ -0,0 +1,181 @@
+import asyncio
+import gc
+import pytest
+from api.utils import single_flight as single_flight_module
+from api.utils.single_flight import SingleFlightCache, single_flight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(single_flight_module, "time", clock)
+    return clock
+
+
+class Source:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        else:
+            await asyncio.sleep(0)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_misses_share_one_computation(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10)
+        source = Source("value")
+        source.release = asyncio.Event()
+        waiters = [asyncio.ensure_future(cache.get("key", source)) for _ in range(5)]
+        await settle()
+        source.release.set()
+        return await asyncio.gather(*waiters), source.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == ["value"] * 5
+    assert calls == 1
+
+
+def test_fresh_result_is_not_recomputed(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10)
+        source = Source("first", "second")
+        first = await cache.get("key", source)
+        clock.now += 9
+        return first, await cache.get("key", source), source.calls
+
+    assert asyncio.run(scenario()) == ("first", "first", 1)
+
+
+def test_stale_result_is_served_while_refreshing(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10, stale_ttl=10)
+        source = Source("first", "second")
+        await cache.get("key", source)
+        clock.now += 15
+        stale = await cache.get("key", source)
+        await settle()
+        return stale, await cache.get("key", source), source.calls
+
+    assert asyncio.run(scenario()) == ("first", "second", 2)
+
+
+def test_stale_result_survives_a_failed_refresh(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10, stale_ttl=10)
+        source = Source("first", RuntimeError("database down"), "third")
+        await cache.get("key", source)
+        clock.now += 15
+        served = [await cache.get("key", source)]
+        await settle()
+        served.append(await cache.get("key", source))
+        await settle()
+        served.append(await cache.get("key", source))
+        return served, source.calls
+
+    served, calls = asyncio.run(scenario())
+    assert served == ["first", "first", "third"]
+    assert calls == 3
+
+
+def test_failed_background_refresh_does_not_leak_unretrieved_exceptions(clock):
+    unhandled = []
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        cache = SingleFlightCache(ttl=10, stale_ttl=10)
+        source = Source("first", RuntimeError("database down"))
+        await cache.get("key", source)
+        clock.now += 15
+        await cache.get("key", source)
+        await settle()
+        gc.collect()
+
+    asyncio.run(scenario())
+    assert unhandled == []
+
+
+def test_miss_error_reaches_every_waiter_and_is_not_cached(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10)
+        source = Source(RuntimeError("database down"), "value")
+        source.release = asyncio.Event()
+        waiters = [asyncio.ensure_future(cache.get("key", source)) for _ in range(3)]
+        await settle()
+        source.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return results, await cache.get("key", source), source.calls
+
+    results, retried, calls = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == "value"
+    assert calls == 2
+
+
+def test_expired_past_stale_window_recomputes_and_propagates_errors(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10, stale_ttl=10)
+        source = Source("first", RuntimeError("database down"))
+        await cache.get("key", source)
+        clock.now += 25
+        await cache.get("key", source)
+
+    with pytest.raises(RuntimeError, match="database down"):
+        asyncio.run(scenario())
+
+
+def test_expires_in_and_invalidate(clock):
+    async def scenario():
+        cache = SingleFlightCache(ttl=10)
+        assert cache.expires_in("key") is None
+        await cache.get("key", Source("value"))
+        clock.now += 4
+        assert cache.expires_in("key") == pytest.approx(6)
+        cache.invalidate("key")
+        assert cache.expires_in("key") is None
+
+    asyncio.run(scenario())
+
+
+def test_decorator_caches_per_arguments_and_refreshes(clock):
+    class Service:
+        def __init__(self):
+            self.calls = []
+
+        @single_flight(ttl=10)
+        async def lookup(self, name):
+            self.calls.append(name)
+            return f"{name}:{len(self.calls)}"
+
+    async def scenario():
+        service = Service()
+        first = [await service.lookup("a"), await service.lookup("b"), await service.lookup("a")]
+        refreshed = await Service.lookup.refresh(service, "a")
+        return first, refreshed, await service.lookup("a"), Service.lookup.expires_in("a")
+
+    first, refreshed, cached, expires_in = asyncio.run(scenario())
+    assert first == ["a:1", "b:2", "a:1"]
+    assert refreshed == cached == "a:3"
+    assert expires_in == pytest.approx(10)
@@ -0,0 +1,99 @@
+import math
+from array import array
+import pytest
+from api.services.spatial_index import GridIndex, ClusterLayer, haversine_km, cluster_cell_size, WORLD_BBOX
+
+POINTS = [
+    (52.52, 13.40),     # 0 Berlin
+    (48.85, 2.35),      # 1 Paris
+    (40.71, -74.00),    # 2 New York
+    (-17.7, 178.0),     # 3 Fiji
+    (-17.8, -179.8),    # 4 Fiji, east of the antimeridian
+    (64.8, -147.7),     # 5 Fairbanks
+    (float("nan"), float("nan")),  # 6 not geolocated
+    (-33.87, 151.21),   # 7 Sydney
+]
+
+
+def make_index(points=POINTS, cell_size=1.0):
+    return GridIndex(array('d', [lat for lat, _ in points]), array('d', [lon for _, lon in points]), cell_size)
+
+
+def brute_within(points, west, south, east, north):
+    def inside_lon(lon):
+        return west <= lon <= east if west <= east else lon >= west or lon <= east
+    return [index for index, (lat, lon) in enumerate(points)
+            if not math.isnan(lat) and south <= lat <= north and inside_lon(lon)]
+
+
+def test_points_without_coordinates_are_not_indexed():
+    index = make_index()
+    assert len(index) == len(POINTS) - 1
+    assert 6 not in index.within(*WORLD_BBOX)
+
+
+@pytest.mark.parametrize("cell_size", [0.5, 1.0, 10.0, 90.0])
+@pytest.mark.parametrize("bbox", [
+    (-10, 40, 20, 60),
+    (-180, -90, 180, 90),
+    (170, -30, -170, 0),
+    (150, -40, -140, 70),
+    (13.40, 52.52, 13.40, 52.52),
+])
+def test_within_matches_brute_force(cell_size, bbox):
+    assert make_index(cell_size=cell_size).within(*bbox) == brute_within(POINTS, *bbox)
+
+
+def test_within_across_antimeridian_returns_both_sides():
+    assert make_index().within(170, -30, -170, 0) == [3, 4]
+
+
+def test_near_sorts_by_distance_and_respects_radius():
+    index = make_index()
+    found = index.near(50.0, 8.0, 1000)
+    assert [idx for _, idx in found] == [1, 0]
+    assert all(distance <= 1000 for distance, _ in found)
+    assert found[0][0] == pytest.approx(haversine_km(50.0, 8.0, *POINTS[1]))
+
+
+def test_near_across_antimeridian():
+    found = make_index().near(-17.75, 179.9, 300)
+    assert sorted(idx for _, idx in found) == [3, 4]
+
+
+def test_near_covering_a_pole_searches_every_longitude():
+    found = make_index().near(89.0, 0.0, 3000)
+    assert [idx for _, idx in found] == [5]
+
+
+def test_cluster_counts_cover_every_point():
+    latitudes = array('d', [lat for lat, _ in POINTS])
+    longitudes = array('d', [lon for _, lon in POINTS])
+    for zoom in range(0, 8):
+        layer = ClusterLayer(latitudes, longitudes, zoom)
+        assert sum(count for _, _, count, _ in layer.within(*WORLD_BBOX)) == len(POINTS) - 1
+
+
+def test_clusters_across_antimeridian():
+    points = [(-17.7, 179.5), (-17.8, 179.9), (-17.6, -179.9), (-17.9, -179.5), (10.0, 0.0)]
+    latitudes = array('d', [lat for lat, _ in points])
+    longitudes = array('d', [lon for _, lon in points])
+    layer = ClusterLayer(latitudes, longitudes, zoom=2)
+    clusters = layer.within(170, -30, -170, 0)
+    # Cells do not wrap, so each side of the antimeridian keeps its own cluster; together they hold the four points.
+    assert sorted(count for _, _, count, _ in clusters) == [2, 2]
+    assert all(member is None for _, _, _, member in clusters)
+    for latitude, longitude, _, _ in clusters:
+        assert -30 <= latitude <= 0 and (longitude >= 170 or longitude <= -170)
+
+
+def test_single_point_cluster_points_at_its_row():
+    latitudes = array('d', [10.0, 50.0])
+    longitudes = array('d', [10.0, 50.0])
+    layer = ClusterLayer(latitudes, longitudes, zoom=6)
+    assert sorted((count, member) for _, _, count, member in layer.within(*WORLD_BBOX)) == [(1, 0), (1, 1)]
+
+
+def test_cluster_cell_size_halves_per_zoom_level():
+    assert cluster_cell_size(0) == 90.0
+    assert cluster_cell_size(3) == cluster_cell_size(2) / 2
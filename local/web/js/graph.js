@@ -43,60 +43,38 @@ const graphApp = (() => {
         const checkboxes = Array.from(document.querySelectorAll(selector));
         return checkboxes.filter(checkbox => checkbox.checked).map(checkbox => checkbox.value);
     };
-    const getSelectedCountryNodes = async () => {
+    const getSelectedCountryGraphs = async () => {
         const countries = getSelectedValues('#country-select input[type="checkbox"]:checked');
-        const dataPromises = countries.map(country => fetchData(`${API_URL}/nodes/relationships/${country}`));
-        const allData = await Promise.all(dataPromises);
-        return allData.flat();
+        const dataPromises = countries.map(country => fetchData(`${API_URL}/nodes/relationships/${encodeURIComponent(country)}?format=graph`));
+        return await Promise.all(dataPromises);
     };
-    const createNode = (id, group) => ({ id, group });
-    const createLink = (source, target) => ({ source, target });
-    const generateGraphData = (data) => {
+    const generateGraphData = (graphs) => {
         const nodes = [];
         const links = [];
         const nodeMap = {};
-        const rootNode = createNode("World", 1);
-        nodes.push(rootNode);
-        nodeMap[rootNode.id] = rootNode;
-        data.forEach(item => {
-            const { c, isp, os, client, n } = item;
-            const countryNodeId = `${c.name}`;
-            if (!nodeMap[countryNodeId]) {
-                const countryNode = createNode(countryNodeId, 2);
-                nodes.push(countryNode);
-                links.push(createLink(rootNode.id, countryNode.id));
-                nodeMap[countryNodeId] = countryNode;
-            }
-            const ispNodeId = `${c.name}-${isp.name}`;
-            if (!nodeMap[ispNodeId]) {
-                const ispNode = createNode(ispNodeId, 3);
-                nodes.push(ispNode);
-                links.push(createLink(countryNodeId, ispNode.id));
-                nodeMap[ispNodeId] = ispNode;
-            }
-            const osNodeId = `${c.name}-${isp.name}-${os.name}`;
-            if (!nodeMap[osNodeId]) {
-                const osNode = createNode(osNodeId, 4);
-                nodes.push(osNode);
-                links.push(createLink(ispNodeId, osNode.id));
-                nodeMap[osNodeId] = osNode;
-            }
-            const clientNodeId = `${c.name}-${isp.name}-${os.name}-${client.name}`;
-            if (!nodeMap[clientNodeId]) {
-                const clientNode = createNode(clientNodeId, 5);
-                nodes.push(clientNode);
-                links.push(createLink(osNodeId, clientNode.id));
-                nodeMap[clientNodeId] = clientNode;
-            }
-            const nodeId = `${n.id}`;
-            if (!nodeMap[nodeId]) {
-                const nNode = createNode(nodeId, 6);
-                nodes.push(nNode);
-                links.push(createLink(clientNodeId, nNode.id));
-                nodeMap[nodeId] = nNode;
-            }
+        graphs.forEach(graph => {
+            const vertices = graph.nodes || [];
+            vertices.forEach(vertex => {
+                if (!nodeMap[vertex.id]) {
+                    const node = { id: vertex.id, group: vertex.group };
+                    nodes.push(node);
+                    nodeMap[vertex.id] = node;
+                }
+            });
+            (graph.links || []).forEach(([source, target]) => {
+                links.push({ source: vertices[source].id, target: vertices[target].id });
+            });
         });
-        return { nodes, links };
+        if (!nodeMap["World"]) {
+            nodes.push({ id: "World", group: 1 });
+        }
+        const seen = new Set();
+        return { nodes, links: links.filter(link => {
+            const key = `${link.source}>${link.target}`;
+            if (seen.has(key)) return false;
+            seen.add(key);
+            return true;
+        }) };
     };
     const initializeGraph = (nodes, links) => {
         const width = window.innerWidth - 200;
@@ -196,8 +174,8 @@ const graphApp = (() => {
         d.fy = null;
     };
     const drawGraph = async () => {
-        const data = await getSelectedCountryNodes();
-        const { nodes, links } = generateGraphData(data);
+        const graphs = await getSelectedCountryGraphs();
+        const { nodes, links } = generateGraphData(graphs);
         initializeGraph(nodes, links);
     };
     const init = () => {
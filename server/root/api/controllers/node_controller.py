@@ -1,5 +1,7 @@
-from quart import jsonify
-from api.services.node_service import NodeService
+import json
+from quart import Response, jsonify
+from api.services.node_service import NodeService, DEFAULT_SUMMARY_METRICS, STATISTICS_DIMENSIONS
+from api.services.cache_refresher import CacheRefresher
 from api.utils.node_helper import NodeHelper
 import logging
 
@@ -12,23 +14,123 @@ class NodeController:
         self.logger = logging.getLogger('quart_app.controller.node_controller')
         self.node_service = NodeService()
         self.helper = NodeHelper()
+        self.refresher = CacheRefresher(self.node_service, self.warm_payloads)
         self.logger.debug("::NodeController:: Initialized.")
 
-    async def get_nodes(self):
+    async def warm_payloads(self):
+        """
+        Builds the pre-encoded responses of the snapshot-backed endpoints for the current snapshot.
+
+        :raises RuntimeError: If any of the responses could not be built.
+        """
+        self.logger.debug("::warm_payloads:: Entering warm_payloads method.")
+        responses = [
+            await self.get_nodes(),
+            await self.get_countries(),
+            await self.get_summary_counts(),
+        ]
+        for data_type in STATISTICS_DIMENSIONS:
+            responses.append(await self.get_statistics(data_type))
+        responses.append(await self.get_heatmap())
+        responses.append(await self.get_choropleth())
+        if any(response is None for response in responses):
+            self.logger.warning("::warm_payloads:: Some payloads could not be warmed.")
+            raise RuntimeError("Some payloads could not be warmed")
+        self.logger.debug("::warm_payloads:: Exiting warm_payloads method.")
+
+    async def is_known_value(self, dimension, value):
+        """
+        Checks a value against the validation index of known dimension values.
+
+        :param dimension: The dimension to check (e.g., country, isp, os, client).
+        :param value: The value to look up.
+        :return: True if some node has the value, False otherwise.
+        """
+        return await self.node_service.is_known_value(dimension, value)
+
+    async def get_readiness(self):
+        """
+        Reports whether the caches have been warmed.
+
+        :return: A JSON response with the cache status, with status 200 when ready and 503 otherwise.
+        """
+        self.logger.debug("::get_readiness:: Entering get_readiness method.")
+        status = self.refresher.status()
+        self.logger.debug(f"::get_readiness:: Cache status: {status}")
+        return jsonify(status), 200 if status["ready"] else 503
+
+    async def get_query_stats(self, limit=None):
+        """
+        Retrieves the latency histograms of the database queries, slowest first.
+
+        :param limit: The maximum number of queries to return (optional).
+        :return: A JSON response containing the per-query latency summaries.
+        """
+        self.logger.debug(f"::get_query_stats:: Entering get_query_stats method with limit: {limit}")
+        stats = self.node_service.fetch_query_stats(limit)
+        self.logger.debug("::get_query_stats:: Exiting get_query_stats method.")
+        return jsonify({"queries": stats}), 200
+
+    async def get_nodes(self, headers=None):
         """
         Retrieves a list of all nodes from the database via NodeService.
 
+        :param headers: The request headers, used for content negotiation and conditional requests.
         :return: A JSON response containing the list of nodes or an error message.
         """
         self.logger.debug("::get_nodes:: Entering get_nodes method.")
         try:
-            nodes = await self.node_service.fetch_nodes()
+            payload = await self.node_service.fetch_payload("nodes", self.node_service.fetch_nodes)
             self.logger.info("::get_nodes:: Successfully retrieved all nodes.")
             self.logger.debug("::get_nodes:: Exiting get_nodes method.")
-            return jsonify(nodes), 200
+            return payload.to_response(headers or {})
         except Exception as e:
             self.logger.exception(f"::get_nodes:: Error in get_nodes: {e}")
 
+    async def get_node_page(self, after=None, limit=None, filters=None):
+        """
+        Retrieves one page of nodes ordered by node id, with the cursor of the next page.
+
+        :param after: The node id of the last node of the previous page (optional).
+        :param limit: The maximum number of nodes in the page (optional).
+        :param filters: Country, OS, client and ISP filters (optional).
+        :return: A JSON response containing the nodes and the next cursor, or an error message.
+        """
+        self.logger.debug(f"::get_node_page:: Entering get_node_page method with after={after}, limit={limit}")
+        try:
+            snapshot, rows, next_cursor = await self.node_service.fetch_node_page(after, limit, **(filters or {}))
+            self.logger.info(f"::get_node_page:: Successfully retrieved a page of {len(rows)} nodes.")
+            self.logger.debug("::get_node_page:: Exiting get_node_page method.")
+            return jsonify({"nodes": snapshot.records(rows), "next": next_cursor}), 200
+        except Exception as e:
+            self.logger.exception(f"::get_node_page:: Error in get_node_page: {e}")
+
+    async def stream_nodes(self, after=None, limit=None, filters=None, batch_size=500):
+        """
+        Streams nodes ordered by node id as newline-delimited JSON, encoding one batch at a time.
+
+        :param after: The node id of the last node already received (optional).
+        :param limit: The maximum number of nodes to stream (optional).
+        :param filters: Country, OS, client and ISP filters (optional).
+        :param batch_size: The number of nodes encoded per chunk.
+        :return: A streaming application/x-ndjson response or an error message.
+        """
+        self.logger.debug(f"::stream_nodes:: Entering stream_nodes method with after={after}, limit={limit}")
+        try:
+            snapshot, rows, next_cursor = await self.node_service.fetch_node_page(after, limit, **(filters or {}))
+
+            async def generate():
+                for start in range(0, len(rows), batch_size):
+                    batch = snapshot.records(rows[start:start + batch_size])
+                    yield "".join(json.dumps(record) + "\n" for record in batch).encode("utf-8")
+
+            self.logger.info(f"::stream_nodes:: Streaming {len(rows)} nodes.")
+            self.logger.debug("::stream_nodes:: Exiting stream_nodes method.")
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else {}
+            return Response(generate(), status=200, headers=headers, content_type="application/x-ndjson")
+        except Exception as e:
+            self.logger.exception(f"::stream_nodes:: Error in stream_nodes: {e}")
+
     async def get_os_types(self):
         """
         Retrieves the types of operating systems associated with the nodes.
@@ -59,18 +161,19 @@ class NodeController:
         except Exception as e:
             self.logger.exception(f"::get_clients:: Error in get_clients: {e}")
 
-    async def get_countries(self):
+    async def get_countries(self, headers=None):
         """
         Retrieves a list of countries where the nodes are located.
 
+        :param headers: The request headers, used for content negotiation and conditional requests.
         :return: A JSON response containing the countries or an error message.
         """
         self.logger.debug("::get_countries:: Entering get_countries method.")
         try:
-            countries = await self.node_service.fetch_countries()
+            payload = await self.node_service.fetch_payload("countries", self.node_service.fetch_countries)
             self.logger.info("::get_countries:: Successfully retrieved countries.")
             self.logger.debug("::get_countries:: Exiting get_countries method.")
-            return jsonify(countries), 200
+            return payload.to_response(headers or {})
         except Exception as e:
             self.logger.exception(f"::get_countries:: Error in get_countries: {e}")
 
@@ -123,15 +226,127 @@ class NodeController:
         except Exception as e:
             self.logger.exception(f"::get_node_details:: Error in get_node_details: {e}")
 
-    async def get_relationships(self, country_name):
+    async def get_nodes_within(self, bbox, limit=None):
+        """
+        Retrieves the nodes inside a bounding box.
+
+        :param bbox: A (west, south, east, north) tuple in degrees.
+        :param limit: The maximum number of nodes to return (optional).
+        :return: A JSON response containing the list of nodes.
+        """
+        self.logger.debug(f"::get_nodes_within:: Entering get_nodes_within method with bbox: {bbox}")
+        try:
+            nodes = await self.node_service.fetch_nodes_within(bbox, limit)
+            self.logger.info(f"::get_nodes_within:: Successfully retrieved {len(nodes)} nodes.")
+            self.logger.debug("::get_nodes_within:: Exiting get_nodes_within method.")
+            return jsonify(nodes), 200
+        except Exception as e:
+            self.logger.exception(f"::get_nodes_within:: Error in get_nodes_within: {e}")
+
+    async def get_nodes_near(self, latitude, longitude, radius_km, limit=None):
+        """
+        Retrieves the nodes within a radius of a location, nearest first.
+
+        :param latitude: Latitude of the center in degrees.
+        :param longitude: Longitude of the center in degrees.
+        :param radius_km: The search radius in kilometers.
+        :param limit: The maximum number of nodes to return (optional).
+        :return: A JSON response containing the list of nodes with their distances.
+        """
+        self.logger.debug(f"::get_nodes_near:: Entering get_nodes_near method with latitude: {latitude}, "
+                          f"longitude: {longitude}, radius_km: {radius_km}")
+        try:
+            nodes = await self.node_service.fetch_nodes_near(latitude, longitude, radius_km, limit)
+            self.logger.info(f"::get_nodes_near:: Successfully retrieved {len(nodes)} nodes.")
+            self.logger.debug("::get_nodes_near:: Exiting get_nodes_near method.")
+            return jsonify(nodes), 200
+        except Exception as e:
+            self.logger.exception(f"::get_nodes_near:: Error in get_nodes_near: {e}")
+
+    async def get_heatmap(self, resolution=0.5, headers=None):
+        """
+        Retrieves the precomputed node density grid.
+
+        :param resolution: Cell edge length in degrees.
+        :param headers: The request headers, used for content negotiation and conditional requests.
+        :return: A JSON response containing the quantized heatmap cells.
+        """
+        self.logger.debug(f"::get_heatmap:: Entering get_heatmap method with resolution: {resolution}")
+        try:
+            payload = await self.node_service.fetch_payload(f"heatmap:{resolution}", self.node_service.fetch_heatmap,
+                                                            resolution)
+            self.logger.info("::get_heatmap:: Successfully retrieved heatmap.")
+            self.logger.debug("::get_heatmap:: Exiting get_heatmap method.")
+            return payload.to_response(headers or {})
+        except Exception as e:
+            self.logger.exception(f"::get_heatmap:: Error in get_heatmap: {e}")
+
+    async def get_choropleth(self, headers=None):
+        """
+        Retrieves the precomputed node counts and classes per country.
+
+        :param headers: The request headers, used for content negotiation and conditional requests.
+        :return: A JSON response containing the choropleth data.
+        """
+        self.logger.debug("::get_choropleth:: Entering get_choropleth method.")
+        try:
+            payload = await self.node_service.fetch_payload("choropleth", self.node_service.fetch_choropleth)
+            self.logger.info("::get_choropleth:: Successfully retrieved choropleth.")
+            self.logger.debug("::get_choropleth:: Exiting get_choropleth method.")
+            return payload.to_response(headers or {})
+        except Exception as e:
+            self.logger.exception(f"::get_choropleth:: Error in get_choropleth: {e}")
+
+    async def get_clusters(self, bbox, zoom):
+        """
+        Retrieves the node clusters inside a map viewport.
+
+        :param bbox: The viewport as a (west, south, east, north) tuple in degrees.
+        :param zoom: The map zoom level.
+        :return: A JSON response with the clusters.
+        """
+        self.logger.debug(f"::get_clusters:: Entering get_clusters method with bbox: {bbox}, zoom: {zoom}")
+        try:
+            data = await self.node_service.fetch_clusters(bbox, zoom)
+            self.logger.info(f"::get_clusters:: Successfully retrieved clusters for zoom: {zoom}")
+            self.logger.debug("::get_clusters:: Exiting get_clusters method.")
+            return jsonify(data), 200
+        except Exception as e:
+            self.logger.exception(f"::get_clusters:: Error in get_clusters: {e}")
+
+    async def get_tree(self, path, headers=None):
+        """
+        Retrieves one level of the node hierarchy below a path.
+
+        :param path: A tuple of hierarchy values from the top (country, ISP, OS, client).
+        :param headers: The request headers, used for content negotiation and conditional requests.
+        :return: A JSON response with the children of the path and their node counts.
+        """
+        self.logger.debug(f"::get_tree:: Entering get_tree method with path: {path}")
+        try:
+            payload = await self.node_service.fetch_payload(f"tree:{'/'.join(path)}", self.node_service.fetch_tree, path)
+            self.logger.info(f"::get_tree:: Successfully retrieved tree for path: {path}")
+            self.logger.debug("::get_tree:: Exiting get_tree method.")
+            return payload.to_response(headers or {})
+        except Exception as e:
+            self.logger.exception(f"::get_tree:: Error in get_tree: {e}")
+
+    async def get_relationships(self, country_name, graph=False, headers=None):
         """
         Retrieves the relationships between nodes for a specific country.
 
         :param country_name: The name of the country to filter relationships by.
+        :param graph: Whether to return the normalized graph format (a node table plus index-based links).
+        :param headers: The request headers, used for content negotiation and conditional requests.
         :return: A JSON response containing the relationships or an error message.
         """
         self.logger.debug(f"::get_relationships:: Entering get_relationships method with country_name: {country_name}")
         try:
+            if graph:
+                payload = await self.node_service.fetch_relationship_payload(country_name)
+                self.logger.info(f"::get_relationships:: Successfully retrieved relationship graph for country: {country_name}")
+                self.logger.debug("::get_relationships:: Exiting get_relationships method.")
+                return payload.to_response(headers or {})
             result = await self.node_service.fetch_relationships(country_name)
             data = self.helper.process_relationships(result)
             self.logger.info(f"::get_relationships:: Successfully retrieved relationships for country: {country_name}")
@@ -140,18 +355,21 @@ class NodeController:
         except Exception as e:
             self.logger.exception(f"::get_relationships:: Error in get_relationships: {e}")
 
-    async def get_summary_counts(self):
+    async def get_summary_counts(self, headers=None, metrics=DEFAULT_SUMMARY_METRICS):
         """
-        Retrieves the summary counts for countries, nodes, and ISPs.
+        Retrieves summary counts, by default for countries, nodes, and ISPs.
 
-        :return: A JSON response containing CountryCount, NumberOfNodes, and ISPCount.
+        :param headers: The request headers, used for content negotiation and conditional requests.
+        :param metrics: The names of the summary metrics to return.
+        :return: A JSON response mapping each requested metric to its value.
         """
-        self.logger.debug("::get_summary_counts:: Entering get_summary_counts method.")
+        self.logger.debug(f"::get_summary_counts:: Entering get_summary_counts method with metrics: {metrics}")
         try:
-            summary = await self.node_service.fetch_summary_counts()
+            payload = await self.node_service.fetch_payload(f"summary_counts:{','.join(metrics)}",
+                                                            self.node_service.fetch_summary_counts, tuple(metrics))
             self.logger.info("::get_summary_counts:: Successfully retrieved summary counts.")
             self.logger.debug("::get_summary_counts:: Exiting get_summary_counts method.")
-            return jsonify(summary), 200
+            return payload.to_response(headers or {})
         except Exception as e:
             self.logger.exception(f"::get_summary_counts:: Error in get_summary_counts: {e}")
 
@@ -170,38 +388,41 @@ class NodeController:
         except Exception as e:
             self.logger.exception(f"::get_latest_nodes:: Error in get_latest_nodes: {e}")
 
-    async def get_filtered_nodes(self, country, os, client, isp):
+    async def get_filtered_nodes(self, country, os, client, isp, headers=None):
         """
         Filters nodes based on country, OS, client, and ISP parameters.
 
+        :param headers: The request headers, used for content negotiation and conditional requests.
         :return: A JSON response containing the filtered nodes or an error message.
         """
         self.logger.debug(
             f"::get_filtered_nodes:: Entering get_filtered_nodes method with filters: country={country}, os={os}, client={client}, isp={isp}")
         try:
-            nodes = await self.node_service.fetch_filtered_nodes(country, os, client, isp)
-            if not nodes:
+            payload = await self.node_service.fetch_filtered_payload(country, os, client, isp)
+            if payload.empty:
                 self.logger.info("::get_filtered_nodes:: No nodes found matching the filter criteria.")
-                self.logger.debug("::get_filtered_nodes:: Exiting get_filtered_nodes method.")
-                return jsonify(nodes), 204
-            self.logger.info(f"::get_filtered_nodes:: Successfully retrieved {len(nodes)} filtered nodes.")
+            else:
+                self.logger.info("::get_filtered_nodes:: Successfully retrieved filtered nodes.")
             self.logger.debug("::get_filtered_nodes:: Exiting get_filtered_nodes method.")
-            return jsonify(nodes), 200
+            return payload.to_response(headers or {})
         except Exception as e:
             self.logger.exception(f"::get_filtered_nodes:: Error in get_filtered_nodes: {e}")
 
-    async def get_statistics(self, data_type):
+    async def get_statistics(self, data_type, headers=None, by=None):
         """
         Retrieves node statistics based on the data type (e.g., os, client, country, isp).
 
         :param data_type: The type of data for which statistics are requested.
+        :param by: A second data type to break the statistics down by (optional).
+        :param headers: The request headers, used for content negotiation and conditional requests.
         :return: A JSON response containing the statistics or an error message.
         """
         self.logger.debug(f"::get_statistics:: Entering get_statistics method with data_type: {data_type}")
         try:
-            statistics = await self.node_service.fetch_statistics(data_type)
+            payload = await self.node_service.fetch_payload(f"statistics:{data_type}:{by or ''}",
+                                                            self.node_service.fetch_statistics, data_type, by)
             self.logger.info(f"::get_statistics:: Successfully retrieved statistics for data type: {data_type}")
             self.logger.debug("::get_statistics:: Exiting get_statistics method.")
-            return jsonify(statistics), 200
+            return payload.to_response(headers or {})
         except Exception as e:
             self.logger.exception(f"::get_statistics:: Error in get_statistics: {e}")
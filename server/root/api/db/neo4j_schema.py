@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+from api.db.neo4j_manager import AsyncSessionManager
+
+# The ingestion scripts own the node properties, so the schema is declared once in scripts/neo4j_schema.py and
+# imported from the scripts directory next to the api package.
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'scripts')
+if SCRIPTS_DIR not in sys.path:
+    sys.path.append(SCRIPTS_DIR)
+
+from neo4j_schema import SCHEMA, DEDUPLICATE_NODES_QUERY, schema_statement  # noqa: E402
+
+
+class Neo4jSchema:
+    """
+    Creates the constraints and indexes the API and the ingestion scripts rely on. Every statement uses
+    IF NOT EXISTS, so bootstrapping an already complete schema is a no-op. Duplicate node ids left by the old
+    check-then-CREATE ingestion are merged first, since they would keep the node_id constraint from being created.
+    """
+
+    def __init__(self, db_manager):
+        """
+        :param db_manager: The AsyncSessionManager used to run the schema statements.
+        """
+        self.logger = logging.getLogger('quart_app.db.neo4j_schema')
+        self.db_manager = db_manager
+
+    @staticmethod
+    def statement(name, kind, label, prop):
+        """
+        Builds the Cypher statement creating one schema entry.
+
+        :return: The CREATE CONSTRAINT or CREATE INDEX statement.
+        """
+        return schema_statement(name, kind, label, prop)
+
+    async def missing(self):
+        """
+        Lists the schema entries that do not exist or whose index is not online yet.
+
+        :return: A list of missing entry names, or None if the schema could not be read.
+        """
+        self.logger.debug("::missing:: Entering missing method.")
+        constraints = await self.db_manager.execute_query("SHOW CONSTRAINTS YIELD name")
+        indexes = await self.db_manager.execute_query("SHOW INDEXES YIELD name, state WHERE state = 'ONLINE'")
+        if constraints is None or indexes is None:
+            self.logger.error("::missing:: Could not read the database schema.")
+            return None
+        existing = {record["name"] for record in constraints + indexes}
+        missing = [name for name, _, _, _ in SCHEMA if name not in existing]
+        self.logger.debug(f"::missing:: Exiting missing method with {len(missing)} missing entries.")
+        return missing
+
+    async def ensure(self):
+        """
+        Creates every missing constraint and index and reports what is still missing afterwards.
+
+        :return: A list of missing entry names, or None if the schema could not be read.
+        """
+        self.logger.debug("::ensure:: Entering ensure method.")
+        if "node_id" in (await self.missing() or []):
+            self.logger.warning("::ensure:: Merging duplicate node ids before creating the node_id constraint.")
+            await self.db_manager.execute_query(DEDUPLICATE_NODES_QUERY, {"now": datetime.now().isoformat()})
+        for name, kind, label, prop in SCHEMA:
+            if await self.db_manager.execute_query(self.statement(name, kind, label, prop)) is None:
+                self.logger.error(f"::ensure:: Could not create schema entry {name}.")
+        missing = await self.missing()
+        if missing and "node_id" in missing:
+            self.logger.critical("::ensure:: The node_id uniqueness constraint could not be created; "
+                                 "node upserts are not race-safe without it.")
+        if missing:
+            self.logger.warning(f"::ensure:: Schema incomplete, missing or not yet online: {', '.join(missing)}")
+        elif missing is not None:
+            self.logger.info("::ensure:: All constraints and indexes are in place.")
+        self.logger.debug("::ensure:: Exiting ensure method.")
+        return missing
+
+
+async def main():
+    db_manager = AsyncSessionManager()
+    try:
+        missing = await Neo4jSchema(db_manager).ensure()
+        print("All constraints and indexes are in place." if missing == [] else f"Missing: {missing}")
+    finally:
+        await db_manager.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+from api.services.node_service import CACHED_DB_METHODS
+
+
+class CacheRefresher:
+    """
+    Background task that warms every cacheable NodeService result when the API starts and keeps it warm.
+
+    Each tick first picks up data version changes announced by the ingestion scripts, refreshes the node snapshot
+    and the single-flight cached queries shortly before they expire, then re-encodes the response payloads for
+    the new snapshot version, so user requests never pay for a cold cache.
+    """
+
+    def __init__(self, node_service, warm_payloads, interval=None, lead=None, jitter=None):
+        """
+        :param node_service: The NodeService whose caches are kept warm.
+        :param warm_payloads: Coroutine function that builds the pre-encoded responses for the current snapshot.
+        :param interval: Seconds between two checks.
+        :param lead: Seconds ahead of expiry at which a result is refreshed.
+        :param jitter: Fraction by which the interval and lead are randomly varied.
+        """
+        self.logger = logging.getLogger('quart_app.services.cache_refresher')
+        self.node_service = node_service
+        self.warm_payloads = warm_payloads
+        self.interval = interval or float(os.getenv('CACHE_REFRESH_INTERVAL', '30'))
+        self.lead = lead or float(os.getenv('CACHE_REFRESH_LEAD', '60'))
+        self.jitter = jitter if jitter is not None else float(os.getenv('CACHE_REFRESH_JITTER', '0.2'))
+        self.ready = False
+        self.warmed_at = None
+        self.warmed_version = None
+        self._task = None
+
+    def _jittered(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def start(self):
+        """
+        Starts the background refresh loop.
+
+        The loop runs in an empty context rather than the app context it is started from, so it never holds on
+        to a request-bound database session; every query of a refresh cycle takes a fresh session from the pool.
+        """
+        if self._task is None or self._task.done():
+            self.logger.info("::start:: Starting background cache refresher.")
+            self._task = contextvars.Context().run(asyncio.ensure_future, self._run())
+
+    async def stop(self):
+        """
+        Cancels the background refresh loop and waits for it to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.logger.info("::stop:: Background cache refresher stopped.")
+
+    def status(self):
+        """
+        Describes how warm the caches are.
+
+        :return: A dictionary with the readiness flag, the warmed snapshot version and its age.
+        """
+        snapshot = self.node_service.snapshots.current
+        return {
+            "ready": self.ready,
+            "snapshot_version": snapshot.version if snapshot is not None else None,
+            "snapshot_age": round(snapshot.age, 1) if snapshot is not None else None,
+            "warmed_version": self.warmed_version,
+            "warmed_at": self.warmed_at,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.exception(f"::_run:: Cache refresh failed: {e}")
+            await asyncio.sleep(self._jittered(self.interval))
+
+    async def tick(self):
+        """
+        Refreshes whatever is about to expire and re-warms the payloads if the snapshot changed.
+        """
+        await self.node_service.sync_data_versions()
+        store = self.node_service.snapshots
+        snapshot = store.current
+        if snapshot is None:
+            snapshot = await store.get()
+        elif snapshot.age > store.max_age - self._jittered(self.lead):
+            self.logger.debug(f"::tick:: Snapshot v{snapshot.version} is about to expire, refreshing.")
+            snapshot = await store.refresh()
+        refreshes = []
+        for name in CACHED_DB_METHODS:
+            method = getattr(type(self.node_service), name)
+            expires_in = method.expires_in()
+            if expires_in is None:
+                refreshes.append(getattr(self.node_service, name)())
+            elif expires_in < self._jittered(self.lead):
+                self.logger.debug(f"::tick:: {name} expires in {expires_in:.0f}s, refreshing.")
+                refreshes.append(method.refresh(self.node_service))
+        results = await asyncio.gather(*refreshes, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self.logger.warning(f"::tick:: Cached query refresh failed: {result}")
+        if snapshot.version != self.warmed_version:
+            started = time.monotonic()
+            await self.warm_payloads()
+            self.warmed_version = snapshot.version
+            self.warmed_at = time.time()
+            self.logger.info(f"::tick:: Payloads for snapshot v{snapshot.version} warmed in "
+                             f"{time.monotonic() - started:.2f}s.")
+        self.ready = True
@@ -1,39 +1,145 @@
+import asyncio
 import logging
-from aiocache import cached, Cache
-from aiocache.serializers import PickleSerializer
+import math
 from api.utils.node_helper import NodeHelper
 from api.db.neo4j_manager import AsyncSessionManager
+from api.db.neo4j_schema import Neo4jSchema
+from api.db.node_queries import NODE_QUERIES, build_filter_query
+from api.services.node_snapshot import NodeSnapshot, NodeSnapshotStore
+from api.utils.payload_cache import EncodedPayload, PayloadCache
+from api.utils.single_flight import single_flight
+
+# Every metric is computed from the snapshot. NumberOfCountries therefore counts the distinct Node.country_name
+# values rather than the Country nodes of the hierarchy, which lag behind until the relationship import runs.
+SUMMARY_METRICS = {
+    "NumberOfCountries": lambda snapshot: sum(1 for country in snapshot.distinct("country") if country is not None),
+    "NumberOfNodes": lambda snapshot: len(set(snapshot.ids)),
+    "NumberOfISPs": lambda snapshot: sum(1 for isp in snapshot.distinct("isp") if isp is not None),
+    "NumberOfOnlineNodes": lambda snapshot: snapshot.statuses.count(0),
+    "NumberOfClients": lambda snapshot: sum(1 for client in snapshot.distinct("client") if client is not None),
+    "NumberOfOSs": lambda snapshot: sum(1 for os in snapshot.distinct("os") if os is not None),
+}
+
+DEFAULT_SUMMARY_METRICS = ("NumberOfCountries", "NumberOfNodes", "NumberOfISPs")
+
+STATISTICS_DIMENSIONS = {"os": "os_type", "client": "client_type", "isp": "isp_type", "country": "country"}
+
+TREE_LEVELS = ("country", "isp", "os", "client")
+
+HEATMAP_RESOLUTIONS = (0.25, 0.5, 1.0, 2.0)
+HEATMAP_LEVELS = 255
+CHOROPLETH_CLASSES = 8
+
+CACHED_DB_METHODS = ("fetch_os_types", "fetch_clients", "fetch_isps", "fetch_node_ids")
 
 
 class NodeService:
     def __init__(self):
         self.logger = logging.getLogger('quart_app.services.node_service')
-        self.db_manager = AsyncSessionManager()
+        self.db_manager = AsyncSessionManager(NODE_QUERIES)
+        self.schema = Neo4jSchema(self.db_manager)
         self.helper = NodeHelper()
-        self.cache = Cache(
-            Cache.MEMORY,
-            serializer=PickleSerializer()
-        )
+        self.snapshots = NodeSnapshotStore(self._load_snapshot, max_age=3600)
+        self.payloads = PayloadCache()
+        self.relationship_payloads = PayloadCache()
+        self.data_versions = None
+        self.relationships_version = 0
         self.logger.debug("::NodeService:: Initialized.")
 
-    @cached(ttl=900, cache=Cache.MEMORY, key="fetch_nodes")
+    async def get_snapshot(self):
+        """
+        Returns the current in-memory node snapshot, loading it on first use.
+
+        :return: The current NodeSnapshot.
+        """
+        return await self.snapshots.get()
+
+    async def sync_data_versions(self):
+        """
+        Compares the data versions the ingestion scripts bump on (:Meta) nodes with the last ones seen and
+        rebuilds the cached results depending on data that changed.
+
+        :return: The names of the data sets that changed since the previous call.
+        """
+        self.logger.debug("::sync_data_versions:: Entering sync_data_versions method.")
+        records = await self.db_manager.execute_read("data_versions")
+        if records is None:
+            self.logger.warning("::sync_data_versions:: Could not read data versions.")
+            return []
+        versions = {record["name"]: record["version"] for record in records}
+        previous, self.data_versions = self.data_versions, versions
+        if previous is None:
+            self.logger.info(f"::sync_data_versions:: Initial data versions: {versions}")
+            return []
+        changed = sorted(name for name in set(versions) | set(previous) if versions.get(name) != previous.get(name))
+        if changed:
+            self.logger.info(f"::sync_data_versions:: Data changed: {changed}, versions: {versions}")
+        if "relationships" in changed:
+            self.relationships_version += 1
+        if "nodes" in changed:
+            await self.snapshots.refresh()
+            for name in CACHED_DB_METHODS:
+                getattr(type(self), name).refresh(self)
+        self.logger.debug("::sync_data_versions:: Exiting sync_data_versions method.")
+        return changed
+
+    async def _load_snapshot(self, version):
+        """
+        Streams every node from the database into a new columnar snapshot.
+
+        :param version: The version number to assign to the new snapshot.
+        :return: A frozen NodeSnapshot.
+        """
+        self.logger.debug(f"::_load_snapshot:: Entering _load_snapshot method with version: {version}")
+        snapshot = NodeSnapshot(version)
+        try:
+            async for record in self.db_manager.stream_read("snapshot"):
+                snapshot.append(record)
+            self.logger.info(f"::_load_snapshot:: Loaded {len(snapshot)} nodes into snapshot v{version}.")
+            self.logger.debug("::_load_snapshot:: Exiting _load_snapshot method with result.")
+            return snapshot.freeze()
+        except Exception as e:
+            self.logger.exception(f"::_load_snapshot:: Error while loading node snapshot: {e}")
+            self.logger.debug("::_load_snapshot:: Exiting _load_snapshot method with error.")
+            raise e
+
+    async def fetch_payload(self, key, fetcher, *args):
+        """
+        Returns the pre-serialized response for a snapshot-backed fetcher, encoding it once per snapshot version.
+
+        :param key: The cache key identifying the response.
+        :param fetcher: The NodeService coroutine method producing the response data.
+        :param args: Arguments passed to the fetcher.
+        :return: An EncodedPayload holding the JSON body and its compressed variants.
+        """
+        self.logger.debug(f"::fetch_payload:: Entering fetch_payload method with key: {key}")
+        try:
+            snapshot = await self.get_snapshot()
+
+            async def build():
+                self.logger.info(f"::fetch_payload:: Encoding {key} for snapshot v{snapshot.version}.")
+                return await asyncio.to_thread(EncodedPayload, await fetcher(*args), snapshot.version)
+
+            payload = await self.payloads.get_or_build(key, snapshot.version, build)
+            self.logger.debug("::fetch_payload:: Exiting fetch_payload method with result.")
+            return payload
+        except Exception as e:
+            self.logger.exception(f"::fetch_payload:: Error while building payload {key}: {e}")
+            self.logger.debug("::fetch_payload:: Exiting fetch_payload method with error.")
+            raise e
+
     async def fetch_nodes(self):
         """
-        Fetches all nodes from the database.
+        Fetches all nodes from the in-memory snapshot.
 
         :return: A list of dictionaries representing nodes with details such as NodeId, Host, Port, etc.
         """
         self.logger.debug("::fetch_nodes:: Entering fetch_nodes method.")
         self.logger.info("::fetch_nodes:: Fetching all nodes...")
-        query = """
-        MATCH (n:Node)
-        RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.client AS Client, n.os AS OS, n.status AS Status,
-        n.latitude AS Latitude, n.longitude AS Longitude, n.isp AS ISP, n.country_name AS Country, n.created_at AS CreatedAt
-        """
         try:
-            result = await self.db_manager.execute_query(query)
-            self.logger.debug(f"::fetch_nodes:: Query executed successfully: {query}")
-            self.logger.info(f"::fetch_nodes:: Fetched {len(result)} nodes.")
+            snapshot = await self.get_snapshot()
+            result = snapshot.records()
+            self.logger.info(f"::fetch_nodes:: Fetched {len(result)} nodes from snapshot v{snapshot.version}.")
             self.logger.debug("::fetch_nodes:: Exiting fetch_nodes method with result.")
             return result
         except Exception as e:
@@ -41,7 +147,50 @@ class NodeService:
             self.logger.debug("::fetch_nodes:: Exiting fetch_nodes method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_os_types")
+    async def fetch_node_page(self, after=None, limit=None, country=None, os=None, client=None, isp=None):
+        """
+        Fetches one page of nodes ordered by node id, optionally filtered like fetch_filtered_nodes.
+
+        :param after: The node id of the last node of the previous page (optional).
+        :param limit: The maximum number of nodes in the page (optional).
+        :param country: The country to filter nodes by (optional).
+        :param os: The operating system to filter nodes by (optional).
+        :param client: The client type to filter nodes by (optional).
+        :param isp: The ISP to filter nodes by (optional).
+        :return: A tuple of the snapshot, the selected row indexes and the cursor of the next page.
+        """
+        self.logger.debug(
+            f"::fetch_node_page:: Entering fetch_node_page method with after={after}, limit={limit}, "
+            f"country={country}, os={os}, client={client}, isp={isp}")
+        try:
+            snapshot = await self.get_snapshot()
+            if any(value is not None for value in (country, os, client, isp)):
+                rows = snapshot.filter(country=country, os=os, client=client, isp=isp)
+            else:
+                rows = range(len(snapshot))
+            rows, next_cursor = snapshot.page(rows, after, limit)
+            self.logger.info(f"::fetch_node_page:: Selected {len(rows)} nodes, next cursor: {next_cursor}.")
+            self.logger.debug("::fetch_node_page:: Exiting fetch_node_page method with result.")
+            return snapshot, rows, next_cursor
+        except Exception as e:
+            self.logger.exception(f"::fetch_node_page:: Error while fetching node page: {e}")
+            self.logger.debug("::fetch_node_page:: Exiting fetch_node_page method with error.")
+            raise e
+
+    async def is_known_value(self, dimension, value):
+        """
+        Checks whether any node has the given value in a dimension, using the snapshot's validation index.
+
+        :param dimension: One of the snapshot dimensions (e.g., country, isp, os, client).
+        :param value: The value to look up.
+        :return: True if the value is known, False otherwise.
+        """
+        snapshot = await self.get_snapshot()
+        known = value in snapshot.known(dimension)
+        self.logger.debug(f"::is_known_value:: {dimension}={value} known: {known}")
+        return known
+
+    @single_flight(ttl=1800, stale_ttl=1800, key="fetch_os_types")
     async def fetch_os_types(self):
         """
         Fetches distinct operating system types used by the nodes.
@@ -50,10 +199,9 @@ class NodeService:
         """
         self.logger.debug("::fetch_os_types:: Entering fetch_os_types method.")
         self.logger.info("::fetch_os_types:: Fetching OS types...")
-        query = "MATCH (n:Node) RETURN DISTINCT n.os AS OS"
         try:
-            records = await self.db_manager.execute_query(query)
-            self.logger.debug(f"::fetch_os_types:: Query executed successfully: {query}")
+            records = await self.db_manager.execute_read("os_types")
+            self.logger.debug("::fetch_os_types:: Query os_types executed successfully.")
             os_types = [record["OS"] for record in records]
             self.logger.info(f"::fetch_os_types:: Fetched {len(os_types)} OS types.")
             self.logger.debug(f"::fetch_os_types:: OS types: {os_types}")
@@ -64,7 +212,7 @@ class NodeService:
             self.logger.debug("::fetch_os_types:: Exiting fetch_os_types method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_clients")
+    @single_flight(ttl=1800, stale_ttl=1800, key="fetch_clients")
     async def fetch_clients(self):
         """
         Fetches distinct client types used by the nodes.
@@ -73,13 +221,9 @@ class NodeService:
         """
         self.logger.debug("::fetch_clients:: Entering fetch_clients method.")
         self.logger.info("::fetch_clients:: Fetching client types...")
-        query = """
-        MATCH (n:Node)
-        RETURN DISTINCT n.client AS Client
-        """
         try:
-            records = await self.db_manager.execute_query(query)
-            self.logger.debug(f"::fetch_clients:: Query executed successfully: {query}")
+            records = await self.db_manager.execute_read("clients")
+            self.logger.debug("::fetch_clients:: Query clients executed successfully.")
             clients = [record["Client"] for record in records]
             self.logger.info(f"::fetch_clients:: Fetched {len(clients)} client types.")
             self.logger.debug(f"::fetch_clients:: Client types: {clients}")
@@ -90,7 +234,6 @@ class NodeService:
             self.logger.debug("::fetch_clients:: Exiting fetch_clients method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_countries")
     async def fetch_countries(self):
         """
         Fetches distinct countries where the nodes are located.
@@ -99,14 +242,9 @@ class NodeService:
         """
         self.logger.debug("::fetch_countries:: Entering fetch_countries method.")
         self.logger.info("::fetch_countries:: Fetching countries...")
-        query = """
-        MATCH (n:Node)
-        RETURN DISTINCT n.country_name AS Country
-        """
         try:
-            records = await self.db_manager.execute_query(query)
-            self.logger.debug(f"::fetch_countries:: Query executed successfully: {query}")
-            countries = [record["Country"] for record in records]
+            snapshot = await self.get_snapshot()
+            countries = snapshot.distinct("country")
             self.logger.info(f"::fetch_countries:: Fetched {len(countries)} countries.")
             self.logger.debug(f"::fetch_countries:: Countries: {countries}")
             self.logger.debug("::fetch_countries:: Exiting fetch_countries method with result.")
@@ -116,7 +254,7 @@ class NodeService:
             self.logger.debug("::fetch_countries:: Exiting fetch_countries method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_isps")
+    @single_flight(ttl=1800, stale_ttl=1800, key="fetch_isps")
     async def fetch_isps(self):
         """
         Fetches distinct Internet Service Providers (ISPs) associated with the nodes.
@@ -125,13 +263,9 @@ class NodeService:
         """
         self.logger.debug("::fetch_isps:: Entering fetch_isps method.")
         self.logger.info("::fetch_isps:: Fetching ISPs...")
-        query = """
-        MATCH (n:Node)
-        RETURN DISTINCT n.isp AS ISP
-        """
         try:
-            records = await self.db_manager.execute_query(query)
-            self.logger.debug(f"::fetch_isps:: Query executed successfully: {query}")
+            records = await self.db_manager.execute_read("isps")
+            self.logger.debug("::fetch_isps:: Query isps executed successfully.")
             isps = [record["ISP"] for record in records]
             self.logger.info(f"::fetch_isps:: Fetched {len(isps)} ISPs.")
             self.logger.debug(f"::fetch_isps:: ISPs: {isps}")
@@ -142,7 +276,7 @@ class NodeService:
             self.logger.debug("::fetch_isps:: Exiting fetch_isps method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_node_ids")
+    @single_flight(ttl=1800, stale_ttl=1800, key="fetch_node_ids")
     async def fetch_node_ids(self):
         """
         Fetches distinct node IDs from the database.
@@ -151,13 +285,9 @@ class NodeService:
         """
         self.logger.debug("::fetch_node_ids:: Entering fetch_node_ids method.")
         self.logger.info("::fetch_node_ids:: Fetching node IDs...")
-        query = """
-        MATCH (n:Node)
-        RETURN DISTINCT n.id AS NodeID
-        """
         try:
-            records = await self.db_manager.execute_query(query)
-            self.logger.debug(f"::fetch_node_ids:: Query executed successfully: {query}")
+            records = await self.db_manager.execute_read("node_ids")
+            self.logger.debug("::fetch_node_ids:: Query node_ids executed successfully.")
             node_ids = [record["NodeID"] for record in records]
             self.logger.info(f"::fetch_node_ids:: Fetched {len(node_ids)} node IDs.")
             self.logger.debug(f"::fetch_node_ids:: Node IDs: {node_ids}")
@@ -168,45 +298,18 @@ class NodeService:
             self.logger.debug("::fetch_node_ids:: Exiting fetch_node_ids method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_summary_counts")
-    async def fetch_summary_counts(self):
-        """
-        Fetches the counts for countries, nodes, and ISPs.
-
-        :return: A dictionary containing CountryCount, NumberOfNodes, and ISPCount.
-        """
-        self.logger.debug("::fetch_summary_counts:: Entering fetch_summary_counts method.")
-        self.logger.info("::fetch_summary_counts:: Fetching summary counts for countries, nodes, and ISPs...")
-        queries = {
-            "NumberOfCountries": """
-                MATCH (n:Country)
-                WHERE n.name IS NOT NULL
-                RETURN COUNT(DISTINCT n.name) AS NumberOfCountries
-            """,
-            "NumberOfNodes": """
-                MATCH (n:Node)
-                RETURN COUNT(DISTINCT n.id) AS NumberOfNodes
-            """,
-            "NumberOfISPs": """
-                MATCH (n:Node)
-                WHERE n.isp IS NOT NULL
-                RETURN COUNT(DISTINCT n.isp) AS NumberOfISPs
-            """
-        }
-        summary = {}
+    async def fetch_summary_counts(self, metrics=DEFAULT_SUMMARY_METRICS):
+        """
+        Computes summary metrics from a single snapshot, so every metric reflects the same node set.
+
+        :param metrics: The names of the SUMMARY_METRICS to compute; defaults to the counts of countries, nodes, and ISPs.
+        :return: A dictionary mapping each requested metric to its value.
+        """
+        self.logger.debug(f"::fetch_summary_counts:: Entering fetch_summary_counts method with metrics: {metrics}")
+        self.logger.info("::fetch_summary_counts:: Fetching summary counts...")
         try:
-            for key, query in queries.items():
-                self.logger.debug(f"::fetch_summary_counts:: Executing query for {key}: {query}")
-                result = await self.db_manager.execute_query(query)
-                if result is None:
-                    self.logger.error(f"::fetch_summary_counts:: Failed to fetch {key} due to database error.")
-                    raise Exception(f"Failed to fetch {key} from the database.")
-                if len(result) > 0:
-                    summary[key] = result[0][key]
-                    self.logger.debug(f"::fetch_summary_counts:: {key} result: {summary[key]}")
-                else:
-                    summary[key] = 0
-                    self.logger.warning(f"::fetch_summary_counts:: No result for {key}, defaulting to 0.")
+            snapshot = await self.get_snapshot()
+            summary = {metric: SUMMARY_METRICS[metric](snapshot) for metric in metrics}
             self.logger.info("::fetch_summary_counts:: Successfully fetched summary counts.")
             self.logger.debug(f"::fetch_summary_counts:: Summary counts: {summary}")
             self.logger.debug("::fetch_summary_counts:: Exiting fetch_summary_counts method with result.")
@@ -216,100 +319,59 @@ class NodeService:
             self.logger.debug("::fetch_summary_counts:: Exiting fetch_summary_counts method with error.")
             raise e
 
-    async def fetch_statistics(self, data_type):
+    async def fetch_statistics(self, data_type, by=None):
         """
-        Fetches statistics for a specific data type (OS, client, ISP, or country).
+        Fetches statistics for a specific data type (OS, client, ISP, or country), optionally broken down by a
+        second data type. Counts come from the count tables materialized with the snapshot.
 
         :param data_type: The type of data for which statistics are being fetched (e.g., os, client, isp, country).
+        :param by: A second data type to break each entry down by (optional).
         :return: A dictionary containing the statistics for the requested data type.
         """
-        self.logger.debug(f"::fetch_statistics:: Entering fetch_statistics method with data_type: {data_type}")
+        self.logger.debug(f"::fetch_statistics:: Entering fetch_statistics method with data_type: {data_type}, by: {by}")
         self.logger.info(f"::fetch_statistics:: Fetching statistics for data type: {data_type}")
         try:
-            total_nodes = await self.fetch_total_nodes()
-            self.logger.debug(f"::fetch_statistics:: Total nodes retrieved: {total_nodes}")
-            queries = {
-                "os":
-                    """
-                        MATCH (n:Node)
-                        WITH CASE
-                            WHEN toLower(n.os) CONTAINS 'linux' THEN 'Linux'
-                            WHEN toLower(n.os) CONTAINS 'windows' THEN 'Windows'
-                            WHEN toLower(n.os) CONTAINS 'macos' THEN 'MacOS'
-                            ELSE 'Other OSs'
-                        END AS type, COUNT(n) AS count, (COUNT(n) * 100.0 / $total) AS percentage
-                        RETURN type, count, percentage
-                        ORDER BY percentage DESC
-                    """,
-                "client":
-                    """
-                        MATCH (n:Node)
-                        WITH CASE
-                            WHEN toLower(n.client) CONTAINS 'geth' THEN 'Geth'
-                            WHEN toLower(n.client) CONTAINS 'nethermind' THEN 'Nethermind'
-                            WHEN toLower(n.client) CONTAINS 'besu' THEN 'Besu'
-                            WHEN toLower(n.client) CONTAINS 'erigon' THEN 'Erigon'
-                            ELSE 'Other Clients'
-                        END AS type, COUNT(n) AS count, (COUNT(n) * 100.0 / $total) AS percentage
-                        RETURN type, count, percentage
-                        ORDER BY percentage DESC
-                    """,
-                "isp":
-                    """
-                        MATCH (n:Node)
-                        WITH CASE
-                            WHEN toLower(n.isp) CONTAINS 'contabo' THEN 'Contabo'
-                            WHEN toLower(n.isp) CONTAINS 'aws' OR toLower(n.isp) CONTAINS 'amazon' THEN 'AWS'
-                            WHEN toLower(n.isp) CONTAINS 'azure' OR toLower(n.isp) CONTAINS 'microsoft' THEN 'Azure'
-                            WHEN toLower(n.isp) CONTAINS 'google' THEN 'Google'
-                            WHEN toLower(n.isp) CONTAINS 'alibaba' THEN 'Alibaba'
-                            WHEN toLower(n.isp) CONTAINS 'oracle' THEN 'Oracle'
-                            WHEN toLower(n.isp) CONTAINS 'ibm' THEN 'IBM'
-                            WHEN toLower(n.isp) CONTAINS 'tencent' THEN 'Tencent'
-                            WHEN toLower(n.isp) CONTAINS 'ovh' THEN 'OVHCloud'
-                            WHEN toLower(n.isp) CONTAINS 'digitalocean' THEN 'DigitalOcean'
-                            WHEN toLower(n.isp) CONTAINS 'linode' OR toLower(n.isp) CONTAINS 'akamai' THEN 'Linode'
-                            WHEN toLower(n.isp) CONTAINS 'salesforce' THEN 'Salesforce'
-                            WHEN toLower(n.isp) CONTAINS 'huawei' AND toLower(n.isp) CONTAINS 'cloud' THEN 'Huawei'
-                            WHEN toLower(n.isp) CONTAINS 'dell' AND toLower(n.isp) CONTAINS 'cloud' THEN 'Dell'
-                            WHEN toLower(n.isp) CONTAINS 'vultr' THEN 'Vultr'
-                            WHEN toLower(n.isp) CONTAINS 'heroku' THEN 'Heroku'
-                            WHEN toLower(n.isp) CONTAINS 'hetzner' THEN 'Hetzner'
-                            WHEN toLower(n.isp) CONTAINS 'scaleway' THEN 'Scaleway'
-                            WHEN toLower(n.isp) CONTAINS 'upcloud' THEN 'Upcloud'
-                            WHEN toLower(n.isp) CONTAINS 'kamatera' THEN 'Kamatera'
-                            ELSE 'Other ISPs'
-                        END AS type, COUNT(n) AS count, (COUNT(n) * 100.0 / $total) AS percentage
-                        RETURN type, count, percentage
-                        ORDER BY percentage DESC
-                    """,
-                "country":
-                    """
-                        MATCH (n:Node)
-                        RETURN n.country_name AS type, COUNT(n) AS count, (COUNT(n) * 100.0 / $total) AS percentage
-                        ORDER BY type ASC
-                    """
-            }
-            if data_type in queries:
-                query = queries[data_type]
-                self.logger.debug(f"::fetch_statistics:: Executing query for {data_type}: {query}")
-                result = await self.db_manager.execute_query(query, {"total": total_nodes})
-                if result is None:
-                    self.logger.error("::fetch_statistics:: Failed to fetch statistics due to database error.")
-                    raise Exception("Failed to fetch statistics from the database.")
-                self.logger.info(f"::fetch_statistics:: Fetched statistics for {data_type}.")
-                self.logger.debug(f"::fetch_statistics:: Statistics result: {result}")
-                self.logger.debug("::fetch_statistics:: Exiting fetch_statistics method with result.")
-                return {data_type: result}
-            else:
-                self.logger.warning(f"::fetch_statistics:: Invalid data type requested: {data_type}")
+            if data_type not in STATISTICS_DIMENSIONS or (by is not None and (by not in STATISTICS_DIMENSIONS or by == data_type)):
+                self.logger.warning(f"::fetch_statistics:: Invalid data type requested: {data_type}, by: {by}")
                 self.logger.debug("::fetch_statistics:: Exiting fetch_statistics method with error.")
                 return {"error": "Invalid data type requested"}
+            snapshot = await self.get_snapshot()
+            total_nodes = len(snapshot)
+            self.logger.debug(f"::fetch_statistics:: Total nodes in snapshot: {total_nodes}")
+            result = self._rank(data_type, snapshot.counts(STATISTICS_DIMENSIONS[data_type]), total_nodes)
+            if by is not None:
+                breakdown = snapshot.cross_counts(STATISTICS_DIMENSIONS[data_type], STATISTICS_DIMENSIONS[by])
+                for item in result:
+                    item["breakdown"] = self._rank(by, breakdown.get(item["type"], {}), item["count"])
+            self.logger.info(f"::fetch_statistics:: Fetched statistics for {data_type}.")
+            self.logger.debug(f"::fetch_statistics:: Statistics result: {result}")
+            self.logger.debug("::fetch_statistics:: Exiting fetch_statistics method with result.")
+            return {data_type: result}
         except Exception as e:
             self.logger.exception(f"::fetch_statistics:: Error while fetching statistics: {e}")
             self.logger.debug("::fetch_statistics:: Exiting fetch_statistics method with error.")
             raise e
 
+    @staticmethod
+    def _rank(data_type, counts, total):
+        """
+        Turns a count table into statistics entries; countries are sorted by name, other types by share.
+
+        :param data_type: The data type the counts belong to.
+        :param counts: A dictionary mapping each value to its node count.
+        :param total: The node count percentages are relative to.
+        :return: A list of dictionaries with type, count and percentage.
+        """
+        result = [
+            {"type": value, "count": count, "percentage": count * 100.0 / total if total else 0.0}
+            for value, count in counts.items()
+        ]
+        if data_type == "country":
+            result.sort(key=lambda item: (item["type"] is None, item["type"] or ""))
+        else:
+            result.sort(key=lambda item: item["percentage"], reverse=True)
+        return result
+
     async def fetch_node_details(self, node_id):
         """
         Fetches detailed information about a specific node by its ID.
@@ -319,14 +381,9 @@ class NodeService:
         """
         self.logger.debug(f"::fetch_node_details:: Entering fetch_node_details method with node_id: {node_id}")
         self.logger.info(f"::fetch_node_details:: Fetching details for node ID: {node_id}")
-        query = """
-                        MATCH (n:Node {id: $node_id})
-                        RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.client AS Client, n.os AS OS, n.status AS Status,
-                        n.latitude AS Latitude, n.longitude AS Longitude, n.isp AS ISP, n.country_name AS Country, n.created_at AS CreatedAt
-                        """
         try:
-            result = await self.db_manager.execute_query(query, {"node_id": node_id})
-            self.logger.debug(f"::fetch_node_details:: Query executed successfully: {query}")
+            result = await self.db_manager.execute_read("node_details", {"node_id": node_id})
+            self.logger.debug("::fetch_node_details:: Query node_details executed successfully.")
             if result:
                 self.logger.info(f"::fetch_node_details:: Details for node ID {node_id} fetched successfully.")
                 self.logger.debug(f"::fetch_node_details:: Node details: {result[0]}")
@@ -348,15 +405,8 @@ class NodeService:
         """
         self.logger.debug(f"::fetch_latest_nodes:: Entering fetch_latest_nodes method with limit: {limit}")
         self.logger.info(f"::fetch_latest_nodes:: Fetching latest {limit} nodes...")
-        query = """
-        MATCH (n:Node)
-        RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.created_at AS CreatedAt,
-               n.country_name AS Country, n.client AS Client, n.os AS OS, n.isp AS ISP
-        ORDER BY n.created_at DESC
-        LIMIT $limit
-        """
         try:
-            result = await self.db_manager.execute_query(query, {"limit": limit})
+            result = await self.db_manager.execute_read("latest_nodes", {"limit": limit})
             nodes = self.helper.process_nodes(result)
             self.logger.info(f"::fetch_latest_nodes:: Fetched {len(nodes)} latest nodes.")
             self.logger.debug(f"::fetch_latest_nodes:: Latest nodes: {nodes}")
@@ -376,14 +426,9 @@ class NodeService:
         """
         self.logger.debug(f"::fetch_relationships:: Entering fetch_relationships method with country_name: {country_name}")
         self.logger.info(f"::fetch_relationships:: Fetching relationships for country: {country_name}")
-        query = """
-        MATCH (root:Root {name: 'World'})-[:HAS_COUNTRY]->(c:Country {name: $country_name})-[:HAS_ISP]->(isp:ISP)
-        -[:HAS_OS]->(os:OS)-[:HAS_CLIENT]->(client:Client)-[:HAS_NODE]->(n:Node) 
-        RETURN root, c, isp, os, client, n
-        """
         try:
-            result = await self.db_manager.execute_query(query, {"country_name": country_name})
-            self.logger.debug(f"::fetch_relationships:: Query executed successfully: {query}")
+            result = await self.db_manager.execute_read("relationships", {"country_name": country_name})
+            self.logger.debug("::fetch_relationships:: Query relationships executed successfully.")
             self.logger.debug(f"::fetch_relationships:: Fetched relationships result: {result}")
             if isinstance(result, dict) and "error" in result:
                 self.logger.warning(f"::fetch_relationships:: Error while fetching relationships for {country_name}: {result}")
@@ -396,31 +441,232 @@ class NodeService:
             self.logger.debug("::fetch_relationships:: Exiting fetch_relationships method with error.")
             raise e
 
-    @cached(ttl=300, cache=Cache.MEMORY, key="fetch_total_nodes")
-    async def fetch_total_nodes(self):
+    async def fetch_tree(self, path):
         """
-        Fetches the total number of nodes available in the database.
+        Fetches one level of the Country -> ISP -> OS -> Client hierarchy with node counts, so the graph explorer
+        can expand branches lazily. Paths naming a client return the nodes of that branch instead.
 
-        :return: The total number of nodes as an integer.
+        :param path: A tuple of hierarchy values from the top, e.g. ("Germany", "Hetzner", "Linux").
+        :return: A dictionary with the path, the level of the children, the branch node count and the children.
         """
-        self.logger.debug("::fetch_total_nodes:: Entering fetch_total_nodes method.")
-        self.logger.info("::fetch_total_nodes:: Fetching total number of nodes...")
-        total_nodes_query = """
-        MATCH (n:Node)
-        RETURN count(n) AS total_nodes
+        self.logger.debug(f"::fetch_tree:: Entering fetch_tree method with path: {path}")
+        try:
+            snapshot = await self.get_snapshot()
+            rows, children = snapshot.subtree(path)
+            if children is None:
+                level = "node"
+                entries = snapshot.records(rows)
+                count = len(entries)
+            else:
+                level = TREE_LEVELS[len(path)]
+                entries = sorted(({"name": name, "count": count} for name, count in children.items() if name is not None),
+                                 key=lambda entry: (-entry["count"], entry["name"]))
+                count = sum(entry["count"] for entry in entries)
+            self.logger.info(f"::fetch_tree:: Fetched {len(entries)} {level} entries for path {path}.")
+            self.logger.debug("::fetch_tree:: Exiting fetch_tree method with result.")
+            return {"path": list(path), "level": level, "count": count, "children": entries}
+        except Exception as e:
+            self.logger.exception(f"::fetch_tree:: Error while fetching tree for path {path}: {e}")
+            self.logger.debug("::fetch_tree:: Exiting fetch_tree method with error.")
+            raise e
+
+    async def fetch_nodes_within(self, bbox, limit=None):
         """
+        Fetches the nodes located inside a bounding box using the snapshot's spatial index.
+
+        :param bbox: A (west, south, east, north) tuple in degrees; west > east crosses the antimeridian.
+        :param limit: The maximum number of nodes to return (optional).
+        :return: A list of node records ordered by node id.
+        """
+        self.logger.debug(f"::fetch_nodes_within:: Entering fetch_nodes_within method with bbox: {bbox}, limit: {limit}")
         try:
-            result = await self.db_manager.execute_query(total_nodes_query)
-            self.logger.debug(f"::fetch_total_nodes:: Query executed successfully: {total_nodes_query}")
-            total_nodes = result[0]["total_nodes"] if result else 0
-            self.logger.info(f"::fetch_total_nodes:: Total number of nodes: {total_nodes}")
-            self.logger.debug("::fetch_total_nodes:: Exiting fetch_total_nodes method with result.")
-            return total_nodes
+            snapshot = await self.get_snapshot()
+            rows = snapshot.spatial_index.within(*bbox)
+            nodes = snapshot.records(rows[:limit] if limit is not None else rows)
+            self.logger.info(f"::fetch_nodes_within:: Found {len(rows)} nodes inside {bbox}.")
+            self.logger.debug("::fetch_nodes_within:: Exiting fetch_nodes_within method with result.")
+            return nodes
         except Exception as e:
-            self.logger.exception(f"::fetch_total_nodes:: Error while fetching total number of nodes: {e}")
-            self.logger.debug("::fetch_total_nodes:: Exiting fetch_total_nodes method with error.")
+            self.logger.exception(f"::fetch_nodes_within:: Error while fetching nodes within bbox: {e}")
+            self.logger.debug("::fetch_nodes_within:: Exiting fetch_nodes_within method with error.")
             raise e
 
+    async def fetch_nodes_near(self, latitude, longitude, radius_km, limit=None):
+        """
+        Fetches the nodes within a great-circle radius of a location, nearest first.
+
+        :param latitude: Latitude of the center in degrees.
+        :param longitude: Longitude of the center in degrees.
+        :param radius_km: The search radius in kilometers.
+        :param limit: The maximum number of nodes to return (optional).
+        :return: A list of node records, each with its Distance in kilometers.
+        """
+        self.logger.debug(f"::fetch_nodes_near:: Entering fetch_nodes_near method with latitude: {latitude}, "
+                          f"longitude: {longitude}, radius_km: {radius_km}, limit: {limit}")
+        try:
+            snapshot = await self.get_snapshot()
+            found = snapshot.spatial_index.near(latitude, longitude, radius_km)
+            nodes = []
+            for distance, row in (found[:limit] if limit is not None else found):
+                node = snapshot.record(row)
+                node["Distance"] = round(distance, 3)
+                nodes.append(node)
+            self.logger.info(f"::fetch_nodes_near:: Found {len(found)} nodes within {radius_km} km.")
+            self.logger.debug("::fetch_nodes_near:: Exiting fetch_nodes_near method with result.")
+            return nodes
+        except Exception as e:
+            self.logger.exception(f"::fetch_nodes_near:: Error while fetching nodes near location: {e}")
+            self.logger.debug("::fetch_nodes_near:: Exiting fetch_nodes_near method with error.")
+            raise e
+
+    async def fetch_heatmap(self, resolution=0.5):
+        """
+        Fetches the node density grid for heatmap layers. Only occupied cells are listed, each as
+        [latitude, longitude, intensity] at the cell center, with intensities quantized to 1..HEATMAP_LEVELS
+        relative to the densest cell, the format leaflet-heat takes directly.
+
+        :param resolution: Cell edge length in degrees, one of HEATMAP_RESOLUTIONS.
+        :return: A dictionary with the resolution, the largest cell count and the cells.
+        """
+        self.logger.debug(f"::fetch_heatmap:: Entering fetch_heatmap method with resolution: {resolution}")
+        try:
+            snapshot = await self.get_snapshot()
+            grid = snapshot.density_grid(resolution)
+            peak = max(grid.values(), default=0)
+            cells = [
+                [round(-90 + (row + 0.5) * resolution, 4), round(-180 + (column + 0.5) * resolution, 4),
+                 -(-count * HEATMAP_LEVELS // peak)]
+                for (row, column), count in sorted(grid.items())
+            ]
+            self.logger.info(f"::fetch_heatmap:: Built heatmap with {len(cells)} cells at {resolution} degrees.")
+            self.logger.debug("::fetch_heatmap:: Exiting fetch_heatmap method with result.")
+            return {"resolution": resolution, "max": peak, "levels": HEATMAP_LEVELS, "cells": cells}
+        except Exception as e:
+            self.logger.exception(f"::fetch_heatmap:: Error while fetching heatmap: {e}")
+            self.logger.debug("::fetch_heatmap:: Exiting fetch_heatmap method with error.")
+            raise e
+
+    async def fetch_choropleth(self):
+        """
+        Fetches node counts per country for choropleth shading, with each country assigned one of
+        CHOROPLETH_CLASSES log-scaled classes so the client does not need to compute breaks.
+
+        :return: A dictionary with the largest country count and a count and class per country.
+        """
+        self.logger.debug("::fetch_choropleth:: Entering fetch_choropleth method.")
+        try:
+            snapshot = await self.get_snapshot()
+            counts = {country: count for country, count in snapshot.counts("country").items() if country is not None}
+            peak = max(counts.values(), default=0)
+            scale = math.log1p(peak) or 1.0
+            countries = {
+                country: {"count": count,
+                          "class": max(1, math.ceil(math.log1p(count) / scale * CHOROPLETH_CLASSES))}
+                for country, count in sorted(counts.items())
+            }
+            self.logger.info(f"::fetch_choropleth:: Built choropleth for {len(countries)} countries.")
+            self.logger.debug("::fetch_choropleth:: Exiting fetch_choropleth method with result.")
+            return {"max": peak, "classes": CHOROPLETH_CLASSES, "countries": countries}
+        except Exception as e:
+            self.logger.exception(f"::fetch_choropleth:: Error while fetching choropleth: {e}")
+            self.logger.debug("::fetch_choropleth:: Exiting fetch_choropleth method with error.")
+            raise e
+
+    async def fetch_clusters(self, bbox, zoom):
+        """
+        Fetches the node clusters of a map viewport. Nodes are clustered on a grid whose cell size follows the
+        zoom level; single-node clusters carry the node id.
+
+        :param bbox: The viewport as a (west, south, east, north) tuple in degrees.
+        :param zoom: The map zoom level.
+        :return: A dictionary with the zoom level and the clusters (Latitude, Longitude, Count and NodeId).
+        """
+        self.logger.debug(f"::fetch_clusters:: Entering fetch_clusters method with bbox: {bbox}, zoom: {zoom}")
+        try:
+            snapshot = await self.get_snapshot()
+            clusters = [
+                {"Latitude": latitude, "Longitude": longitude, "Count": count,
+                 "NodeId": snapshot.ids[row] if row is not None else None}
+                for latitude, longitude, count, row in snapshot.clusters(zoom).within(*bbox)
+            ]
+            self.logger.info(f"::fetch_clusters:: Fetched {len(clusters)} clusters for zoom {zoom}.")
+            self.logger.debug("::fetch_clusters:: Exiting fetch_clusters method with result.")
+            return {"zoom": zoom, "clusters": clusters}
+        except Exception as e:
+            self.logger.exception(f"::fetch_clusters:: Error while fetching clusters: {e}")
+            self.logger.debug("::fetch_clusters:: Exiting fetch_clusters method with error.")
+            raise e
+
+    async def fetch_relationship_graph(self, country_name):
+        """
+        Fetches the hierarchy of a country as a normalized graph: every World, Country, ISP, OS, Client and Node
+        vertex appears once in a node table, and edges refer to vertices by their index in that table.
+
+        :param country_name: The name of the country to fetch relationships for.
+        :return: A dictionary with 'nodes' ({id, group} entries) and 'links' ([source, target] index pairs).
+        """
+        self.logger.debug(f"::fetch_relationship_graph:: Entering fetch_relationship_graph method with country_name: {country_name}")
+        try:
+            records = await self.db_manager.execute_read("relationship_graph", {"country_name": country_name})
+            nodes = []
+            links = []
+            index = {}
+
+            def vertex(vertex_id, group, parent=None):
+                position = index.get(vertex_id)
+                if position is None:
+                    position = index[vertex_id] = len(nodes)
+                    nodes.append({"id": vertex_id, "group": group})
+                    if parent is not None:
+                        links.append([parent, position])
+                return position
+
+            world = vertex("World", 1)
+            country = vertex(country_name, 2, world)
+            for record in records:
+                isp_id = f"{country_name}-{record['ISP']}"
+                os_id = f"{isp_id}-{record['OS']}"
+                client_id = f"{os_id}-{record['Client']}"
+                isp = vertex(isp_id, 3, country)
+                os = vertex(os_id, 4, isp)
+                client = vertex(client_id, 5, os)
+                vertex(f"{record['NodeId']}", 6, client)
+            self.logger.info(f"::fetch_relationship_graph:: Built graph of {len(nodes)} vertices from {len(records)} paths for {country_name}.")
+            self.logger.debug("::fetch_relationship_graph:: Exiting fetch_relationship_graph method with result.")
+            return {"nodes": nodes, "links": links}
+        except Exception as e:
+            self.logger.exception(f"::fetch_relationship_graph:: Error while fetching relationship graph for {country_name}: {e}")
+            self.logger.debug("::fetch_relationship_graph:: Exiting fetch_relationship_graph method with error.")
+            raise e
+
+    async def fetch_relationship_payload(self, country_name):
+        """
+        Returns the pre-serialized relationship graph of a country. Graphs are rebuilt when the scripts report a
+        relationships change or the snapshot is refreshed.
+
+        :param country_name: The name of the country.
+        :return: An EncodedPayload holding the graph.
+        """
+        self.logger.debug(f"::fetch_relationship_payload:: Entering fetch_relationship_payload method with country_name: {country_name}")
+        snapshot = await self.get_snapshot()
+        version = (snapshot.version, self.relationships_version)
+        key = f"relationships:{country_name}"
+
+        async def build():
+            self.logger.info(f"::fetch_relationship_payload:: Encoding relationship graph of {country_name}.")
+            return await asyncio.to_thread(EncodedPayload, await self.fetch_relationship_graph(country_name), version)
+
+        return await self.relationship_payloads.get_or_build(key, version, build)
+
+    def fetch_query_stats(self, limit=None):
+        """
+        Lists the latency of every executed database query, slowest first.
+
+        :param limit: The maximum number of queries to return (optional).
+        :return: A list of per-query latency summaries.
+        """
+        return self.db_manager.registry.slowest(limit)
+
     async def fetch_filtered_nodes(self, country=None, os=None, client=None, isp=None):
         """
         Fetches nodes that match the given filter criteria (country, OS, client, and ISP).
@@ -434,20 +680,10 @@ class NodeService:
         self.logger.debug(
             f"::fetch_filtered_nodes:: Entering fetch_filtered_nodes method with filters: country={country}, os={os}, client={client}, isp={isp}")
         self.logger.info(f"::fetch_filtered_nodes:: Fetching filtered nodes with country={country}, os={os}, client={client}, isp={isp}")
-        query = """
-        MATCH (n:Node)
-        WHERE 
-            ($country IS NULL OR toLower(n.country_name) = toLower($country)) AND
-            ($os IS NULL OR toLower(n.os) = toLower($os)) AND
-            ($client IS NULL OR toLower(n.client) = toLower($client)) AND
-            ($isp IS NULL OR toLower(n.isp) = toLower($isp))
-        RETURN n.id AS NodeId, n.host AS Host, n.port AS Port, n.client AS Client, n.os AS OS, n.status AS Status,
-               n.latitude AS Latitude, n.longitude AS Longitude, n.isp AS ISP, n.country_name AS Country, n.created_at AS CreatedAt
-        """
         try:
-            params = {"country": country, "os": os, "client": client, "isp": isp}
-            self.logger.debug(f"::fetch_filtered_nodes:: Executing query with parameters: {params}")
-            result = await self.db_manager.execute_query(query, params)
+            snapshot = await self.get_snapshot()
+            rows = snapshot.filter(country=country, os=os, client=client, isp=isp)
+            result = snapshot.records(rows)
             self.logger.info(f"::fetch_filtered_nodes:: Fetched {len(result)} filtered nodes.")
             self.logger.debug(f"::fetch_filtered_nodes:: Filtered nodes result: {result}")
             self.logger.debug("::fetch_filtered_nodes:: Exiting fetch_filtered_nodes method with result.")
@@ -456,3 +692,60 @@ class NodeService:
             self.logger.exception(f"::fetch_filtered_nodes:: Error while fetching filtered nodes: {e}")
             self.logger.debug("::fetch_filtered_nodes:: Exiting fetch_filtered_nodes method with error.")
             raise e
+
+    async def query_filtered_nodes(self, filters):
+        """
+        Fetches the nodes matching the given filters straight from the database with an index-backed query.
+
+        :param filters: Filter names of FILTER_PROPERTIES mapped to the wanted value.
+        :return: A list of nodes shaped like the snapshot records.
+        """
+        self.logger.debug(f"::query_filtered_nodes:: Entering query_filtered_nodes method with filters: {filters}")
+        try:
+            name, parameters = build_filter_query(filters)
+            records = await self.db_manager.execute_read(name, parameters)
+            if records is None:
+                raise RuntimeError("Filtered node query failed.")
+            snapshot = NodeSnapshot()
+            for record in records:
+                snapshot.append(record)
+            result = snapshot.freeze().records()
+            self.logger.info(f"::query_filtered_nodes:: Queried {len(result)} filtered nodes.")
+            self.logger.debug("::query_filtered_nodes:: Exiting query_filtered_nodes method with result.")
+            return result
+        except Exception as e:
+            self.logger.exception(f"::query_filtered_nodes:: Error while querying filtered nodes: {e}")
+            self.logger.debug("::query_filtered_nodes:: Exiting query_filtered_nodes method with error.")
+            raise e
+
+    async def fetch_filtered_payload(self, country=None, os=None, client=None, isp=None):
+        """
+        Returns the pre-serialized nodes for a filter combination. Once a snapshot is loaded, every
+        combination of known values is encoded once per snapshot version and combinations with an unknown
+        value short-circuit to an empty result; before that, the filters run as an indexed database query.
+
+        :param country: The country to filter nodes by (optional).
+        :param os: The operating system to filter nodes by (optional).
+        :param client: The client type to filter nodes by (optional).
+        :param isp: The ISP to filter nodes by (optional).
+        :return: An EncodedPayload holding the matching nodes.
+        """
+        filters = {name: value.lower() for name, value in
+                   (("country", country), ("os", os), ("client", client), ("isp", isp)) if value is not None}
+        self.logger.debug(f"::fetch_filtered_payload:: Entering fetch_filtered_payload method with filters: {filters}")
+        try:
+            snapshot = self.snapshots.current
+            if snapshot is None:
+                self.logger.info("::fetch_filtered_payload:: No snapshot loaded yet, querying the database.")
+                return await asyncio.to_thread(EncodedPayload, await self.query_filtered_nodes(filters), 0)
+            if any(value not in snapshot.lowered(name) for name, value in filters.items()):
+                self.logger.debug("::fetch_filtered_payload:: Exiting fetch_filtered_payload method with no match.")
+                return EncodedPayload([], snapshot.version)
+            key = "filtered:" + "|".join(f"{name}={value}" for name, value in filters.items())
+            payload = await self.fetch_payload(key, self.fetch_filtered_nodes, country, os, client, isp)
+            self.logger.debug("::fetch_filtered_payload:: Exiting fetch_filtered_payload method with result.")
+            return payload
+        except Exception as e:
+            self.logger.exception(f"::fetch_filtered_payload:: Error while fetching filtered payload: {e}")
+            self.logger.debug("::fetch_filtered_payload:: Exiting fetch_filtered_payload method with error.")
+            raise e
@@ -0,0 +1,481 @@
+import asyncio
+import logging
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from api.services.spatial_index import GridIndex, ClusterLayer
+
+EPOCH = datetime(1970, 1, 1)
+MISSING_STATUS = -1
+MISSING_TIMESTAMP = -(2 ** 63)
+
+
+class NodeSnapshot:
+    """
+    Immutable, column-oriented copy of every Node in the database.
+
+    Strings that repeat across nodes (country, ISP, OS, client and their classified types) are interned into
+    per-dimension value tables and stored as integer codes, coordinates are kept in float arrays and creation
+    times as epoch microseconds, so a snapshot of the whole node set stays compact and cheap to scan. Node ids
+    are kept as strings and rows are sorted by them in Python when the snapshot is frozen, so keyset pagination
+    by bisection does not depend on the database collation.
+    """
+
+    DIMENSIONS = {
+        "country": "Country",
+        "isp": "ISP",
+        "os": "OS",
+        "client": "Client",
+        "isp_type": "ISPType",
+        "os_type": "OSType",
+        "client_type": "ClientType",
+    }
+
+    AGGREGATE_DIMENSIONS = ("country", "isp_type", "os_type", "client_type")
+
+    TREE_LEVELS = ("country", "isp_type", "os_type", "client_type")
+
+    def __init__(self, version=0):
+        self.logger = logging.getLogger('quart_app.services.node_snapshot')
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.ids = []
+        self.hosts = []
+        self.ports = []
+        self.statuses = array('i')
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.created_at = array('q')
+        self.codes = {dimension: array('I') for dimension in self.DIMENSIONS}
+        self.values = {dimension: [] for dimension in self.DIMENSIONS}
+        self._interned = {dimension: {} for dimension in self.DIMENSIONS}
+        self._counts = {}
+        self._cross_counts = {}
+        self._known = {}
+        self._lowered = {}
+        self._spatial_index = None
+        self._cluster_layers = {}
+        self._density_grids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def age(self):
+        """
+        Seconds elapsed since the snapshot was loaded.
+        """
+        return time.monotonic() - self.loaded_at
+
+    def append(self, record):
+        """
+        Appends a node record (as returned by the snapshot load query) to the columns.
+
+        :param record: A dictionary with NodeId, Host, Port, Status, Latitude, Longitude, CreatedAt and dimension keys.
+        """
+        node_id = record.get("NodeId")
+        self.ids.append("" if node_id is None else str(node_id))
+        self.hosts.append(record.get("Host"))
+        self.ports.append(record.get("Port"))
+        status = record.get("Status")
+        self.statuses.append(MISSING_STATUS if status is None else int(status))
+        self.latitudes.append(self._to_float(record.get("Latitude")))
+        self.longitudes.append(self._to_float(record.get("Longitude")))
+        self.created_at.append(self._to_epoch_micros(record.get("CreatedAt")))
+        for dimension, key in self.DIMENSIONS.items():
+            self.codes[dimension].append(self._intern(dimension, record.get(key)))
+
+    def freeze(self):
+        """
+        Drops build-time lookup tables once every record has been appended, sorts the rows by node id and
+        materializes the count tables.
+
+        :return: The snapshot itself.
+        """
+        self._interned = None
+        self._sort_rows()
+        self._aggregate()
+        self.loaded_at = time.monotonic()
+        self.logger.info(f"::freeze:: Snapshot v{self.version} holds {len(self)} nodes.")
+        return self
+
+    def _sort_rows(self):
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        if all(row == position for position, row in enumerate(order)):
+            return
+        self.logger.debug("::_sort_rows:: Reordering snapshot rows by node id.")
+        self.ids = [self.ids[row] for row in order]
+        self.hosts = [self.hosts[row] for row in order]
+        self.ports = [self.ports[row] for row in order]
+        self.statuses = array('i', (self.statuses[row] for row in order))
+        self.latitudes = array('d', (self.latitudes[row] for row in order))
+        self.longitudes = array('d', (self.longitudes[row] for row in order))
+        self.created_at = array('q', (self.created_at[row] for row in order))
+        self.codes = {dimension: array('I', (codes[row] for row in order)) for dimension, codes in self.codes.items()}
+
+    def _intern(self, dimension, value):
+        interned = self._interned[dimension]
+        code = interned.get(value)
+        if code is None:
+            code = len(self.values[dimension])
+            interned[value] = code
+            self.values[dimension].append(value)
+        return code
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value) if value not in (None, "") else math.nan
+        except (TypeError, ValueError):
+            return math.nan
+
+    @staticmethod
+    def _to_epoch_micros(value):
+        if not value:
+            return MISSING_TIMESTAMP
+        try:
+            created_at = datetime.fromisoformat(str(value))
+        except ValueError:
+            return MISSING_TIMESTAMP
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        return (created_at - EPOCH) // timedelta(microseconds=1)
+
+    def value(self, dimension, row):
+        """
+        Returns the value of a dimension for a row.
+
+        :param dimension: One of the keys of DIMENSIONS.
+        :param row: Row index within the snapshot.
+        :return: The interned value.
+        """
+        return self.values[dimension][self.codes[dimension][row]]
+
+    def record(self, row):
+        """
+        Rebuilds the public node record for a row.
+
+        :param row: Row index within the snapshot.
+        :return: A dictionary shaped like the rows of the /nodes endpoint.
+        """
+        latitude = self.latitudes[row]
+        longitude = self.longitudes[row]
+        status = self.statuses[row]
+        created_at = self.created_at[row]
+        return {
+            "NodeId": self.ids[row],
+            "Host": self.hosts[row],
+            "Port": self.ports[row],
+            "Client": self.value("client", row),
+            "OS": self.value("os", row),
+            "Status": None if status == MISSING_STATUS else status,
+            "Latitude": None if math.isnan(latitude) else latitude,
+            "Longitude": None if math.isnan(longitude) else longitude,
+            "ISP": self.value("isp", row),
+            "Country": self.value("country", row),
+            "CreatedAt": None if created_at == MISSING_TIMESTAMP
+            else (EPOCH + timedelta(microseconds=created_at)).isoformat(),
+        }
+
+    def records(self, rows=None):
+        """
+        Rebuilds node records for the given rows, or for every row.
+
+        :param rows: An iterable of row indexes (optional).
+        :return: A list of node records.
+        """
+        rows = range(len(self)) if rows is None else rows
+        return [self.record(row) for row in rows]
+
+    def distinct(self, dimension):
+        """
+        Returns the distinct values of a dimension in first-seen order.
+
+        :param dimension: One of the keys of DIMENSIONS.
+        :return: A list of distinct values.
+        """
+        return list(self.values[dimension])
+
+    def known(self, dimension):
+        """
+        Returns the set of values of a dimension for membership checks. The set is memoized per snapshot.
+
+        :param dimension: One of the keys of DIMENSIONS.
+        :return: A frozenset of the non-null values.
+        """
+        if dimension not in self._known:
+            self._known[dimension] = frozenset(value for value in self.values[dimension] if value is not None)
+        return self._known[dimension]
+
+    def counts(self, dimension):
+        """
+        Counts nodes per value of a dimension. The result is memoized since the snapshot never changes.
+
+        :param dimension: One of the keys of DIMENSIONS.
+        :return: A dictionary mapping each value to its node count.
+        """
+        if dimension not in self._counts:
+            tally = [0] * len(self.values[dimension])
+            for code in self.codes[dimension]:
+                tally[code] += 1
+            self._counts[dimension] = dict(zip(self.values[dimension], tally))
+        return self._counts[dimension]
+
+    def cross_counts(self, first, second):
+        """
+        Counts nodes per combination of values of two dimensions.
+
+        :param first: One of AGGREGATE_DIMENSIONS (or any key of DIMENSIONS).
+        :param second: Another dimension.
+        :return: A dictionary mapping each value of the first dimension to a dictionary of second-dimension
+                 values and their node counts.
+        """
+        key = (first, second)
+        if key not in self._cross_counts:
+            tally = {}
+            for pair in zip(self.codes[first], self.codes[second]):
+                tally[pair] = tally.get(pair, 0) + 1
+            self._cross_counts[key] = self._decode_cross(first, second, tally)
+        return self._cross_counts[key]
+
+    def _decode_cross(self, first, second, tally):
+        first_values = self.values[first]
+        second_values = self.values[second]
+        table = {}
+        for (first_code, second_code), count in tally.items():
+            table.setdefault(first_values[first_code], {})[second_values[second_code]] = count
+        return table
+
+    def _aggregate(self):
+        """
+        Builds the per-dimension and pairwise count tables of AGGREGATE_DIMENSIONS in one pass over the rows.
+        """
+        dimensions = self.AGGREGATE_DIMENSIONS
+        pairs = [(first, second) for index, first in enumerate(dimensions) for second in dimensions[index + 1:]]
+        single = {dimension: [0] * len(self.values[dimension]) for dimension in dimensions}
+        cross = {pair: {} for pair in pairs}
+        columns = [self.codes[dimension] for dimension in dimensions]
+        positions = {dimension: index for index, dimension in enumerate(dimensions)}
+        pair_positions = [(pair, positions[pair[0]], positions[pair[1]]) for pair in pairs]
+        for codes in zip(*columns):
+            for dimension, code in zip(dimensions, codes):
+                single[dimension][code] += 1
+            for pair, first, second in pair_positions:
+                tally = cross[pair]
+                key = (codes[first], codes[second])
+                tally[key] = tally.get(key, 0) + 1
+        for dimension, tally in single.items():
+            self._counts[dimension] = dict(zip(self.values[dimension], tally))
+        for (first, second), tally in cross.items():
+            self._cross_counts[(first, second)] = self._decode_cross(first, second, tally)
+            self._cross_counts[(second, first)] = self._decode_cross(
+                second, first, {(second_code, first_code): count for (first_code, second_code), count in tally.items()})
+
+    @property
+    def spatial_index(self):
+        """
+        Grid index over node coordinates, built on first use.
+        """
+        if self._spatial_index is None:
+            self._spatial_index = GridIndex(self.latitudes, self.longitudes)
+        return self._spatial_index
+
+    def clusters(self, zoom):
+        """
+        Returns the grid clusters of node coordinates for a map zoom level, building them on first use.
+
+        :param zoom: The map zoom level.
+        :return: A ClusterLayer.
+        """
+        layer = self._cluster_layers.get(zoom)
+        if layer is None:
+            layer = self._cluster_layers[zoom] = ClusterLayer(self.latitudes, self.longitudes, zoom)
+            self.logger.debug(f"::clusters:: Built {len(layer.counts)} clusters for zoom {zoom} in snapshot v{self.version}.")
+        return layer
+
+    def density_grid(self, resolution):
+        """
+        Counts nodes per cell of a fixed latitude/longitude grid, building the grid on first use.
+
+        :param resolution: Cell edge length in degrees.
+        :return: A dictionary mapping (row, column) cell coordinates, counted from (-90, -180), to node counts.
+        """
+        grid = self._density_grids.get(resolution)
+        if grid is None:
+            grid = {}
+            rows = int(round(180 / resolution))
+            columns = int(round(360 / resolution))
+            for latitude, longitude in zip(self.latitudes, self.longitudes):
+                if math.isnan(latitude) or math.isnan(longitude):
+                    continue
+                cell = (min(int((latitude + 90) / resolution), rows - 1),
+                        min(int((longitude + 180) / resolution), columns - 1))
+                grid[cell] = grid.get(cell, 0) + 1
+            self._density_grids[resolution] = grid
+        return grid
+
+    def subtree(self, path):
+        """
+        Selects the rows below a branch of the Country -> ISP -> OS -> Client hierarchy.
+
+        :param path: A sequence of at most len(TREE_LEVELS) exact values, one per level from the top.
+        :return: A tuple of the matching rows and a dictionary counting them per value of the next level
+                 (None once the path reaches the client level).
+        """
+        rows = range(len(self))
+        for dimension, value in zip(self.TREE_LEVELS, path):
+            try:
+                code = self.values[dimension].index(value)
+            except ValueError:
+                return [], {}
+            column = self.codes[dimension]
+            rows = [row for row in rows if column[row] == code]
+        if len(path) >= len(self.TREE_LEVELS):
+            return list(rows), None
+        dimension = self.TREE_LEVELS[len(path)]
+        if not path:
+            children = self.counts(dimension)
+        else:
+            column = self.codes[dimension]
+            values = self.values[dimension]
+            tally = {}
+            for row in rows:
+                tally[column[row]] = tally.get(column[row], 0) + 1
+            children = {values[code]: count for code, count in tally.items()}
+        return rows, children
+
+    def lowered(self, dimension):
+        """
+        Returns the inverted index of a dimension keyed by lower-cased value, built on first use.
+
+        :param dimension: One of the keys of DIMENSIONS.
+        :return: A dictionary mapping lower-cased values to the ascending indexes of the rows holding them.
+        """
+        index = self._lowered.get(dimension)
+        if index is None:
+            keys = [str(value).lower() if value is not None else None for value in self.values[dimension]]
+            index = {}
+            for row, code in enumerate(self.codes[dimension]):
+                key = keys[code]
+                if key is not None:
+                    index.setdefault(key, array('I')).append(row)
+            self._lowered[dimension] = index
+        return index
+
+    def filter(self, **criteria):
+        """
+        Returns the rows whose dimension values match every given criterion, ignoring case. Each criterion is
+        looked up in the lower-cased inverted index of its dimension and the row lists are intersected,
+        smallest first.
+
+        :param criteria: Dimension names mapped to the wanted value; None values are ignored.
+        :return: A list of matching row indexes.
+        """
+        postings = []
+        for dimension, expected in criteria.items():
+            if expected is None:
+                continue
+            rows = self.lowered(dimension).get(str(expected).lower())
+            if rows is None:
+                return []
+            postings.append(rows)
+        if not postings:
+            return list(range(len(self)))
+        postings.sort(key=len)
+        rows = list(postings[0])
+        for other in postings[1:]:
+            other = set(other)
+            rows = [row for row in rows if row in other]
+        return rows
+
+    def page(self, rows, after=None, limit=None):
+        """
+        Slices an ascending sequence of rows to the ones whose node id sorts after a cursor.
+
+        :param rows: Ascending row indexes, e.g. range(len(snapshot)) or the result of filter().
+        :param after: The node id of the last row of the previous page (optional).
+        :param limit: The maximum number of rows to return (optional).
+        :return: A tuple of the selected rows and the cursor for the next page, or None on the last page.
+        """
+        start = bisect_left(rows, bisect_right(self.ids, str(after))) if after is not None else 0
+        end = len(rows) if limit is None else min(start + limit, len(rows))
+        selected = rows[start:end]
+        next_cursor = self.ids[selected[-1]] if selected and end < len(rows) else None
+        return selected, next_cursor
+
+
+class NodeSnapshotStore:
+    """
+    Holds the current NodeSnapshot and replaces it atomically.
+
+    Readers always get the snapshot that is current when they ask; a refresh builds a complete new snapshot
+    before swapping the reference, so nobody waits for a reload except the very first caller.
+    """
+
+    def __init__(self, loader, max_age=900):
+        """
+        :param loader: Coroutine function taking a version number and returning a frozen NodeSnapshot.
+        :param max_age: Seconds after which a snapshot is refreshed in the background.
+        """
+        self.logger = logging.getLogger('quart_app.services.node_snapshot')
+        self._loader = loader
+        self._max_age = max_age
+        self._snapshot = None
+        self._version = 0
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+
+    @property
+    def current(self):
+        return self._snapshot
+
+    @property
+    def max_age(self):
+        return self._max_age
+
+    async def get(self):
+        """
+        Returns the current snapshot, loading it on first use and scheduling a refresh when it is stale.
+
+        :return: The current NodeSnapshot.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return await self._reload(None)
+        if snapshot.age > self._max_age and (self._refresh_task is None or self._refresh_task.done()):
+            self.logger.debug(f"::get:: Snapshot v{snapshot.version} is stale, refreshing in the background.")
+            self._refresh_task = asyncio.ensure_future(self._reload(snapshot))
+        return snapshot
+
+    async def refresh(self):
+        """
+        Builds a new snapshot and swaps it in.
+
+        :return: The current NodeSnapshot.
+        """
+        return await self._reload(self._snapshot)
+
+    async def _reload(self, expected):
+        """
+        Loads a new snapshot unless the one in place is no longer the expected one, in which case another
+        caller already replaced it and its result is reused.
+
+        :param expected: The snapshot the caller wants to replace.
+        :return: The current NodeSnapshot.
+        """
+        async with self._lock:
+            if self._snapshot is not expected:
+                return self._snapshot
+            self._version += 1
+            self.logger.info(f"::_reload:: Loading node snapshot v{self._version}.")
+            try:
+                snapshot = await self._loader(self._version)
+            except Exception as e:
+                self.logger.exception(f"::_reload:: Failed to load node snapshot: {e}")
+                if self._snapshot is None:
+                    raise
+                return self._snapshot
+            self._snapshot = snapshot
+            return snapshot
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import gzip
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from quart import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Payloads are encoded on a miss while a request waits, so compression favours speed over the last few percent.
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Filter and tree keys come from query strings, so the number of payloads per data version is capped.
+PAYLOAD_CACHE_SIZE = 256
+
+
+class EncodedPayload:
+    """
+    A JSON response body encoded once, together with its compressed variants and strong ETags. Encoding a large
+    payload is CPU-bound, so callers on the event loop build it with asyncio.to_thread.
+    """
+
+    def __init__(self, data, version):
+        """
+        :param data: The JSON-serializable response data.
+        :param version: The data version the payload was built from.
+        """
+        self.version = version
+        self.empty = not data
+        body = json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        self.etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+                      for encoding in self.variants}
+
+    def select_encoding(self, accept_encoding):
+        """
+        Picks the smallest variant the client accepts.
+
+        :param accept_encoding: The value of the Accept-Encoding request header.
+        :return: The name of the selected encoding.
+        """
+        accepted = set()
+        for token in (accept_encoding or "").split(","):
+            name, _, params = token.partition(";")
+            quality = params.strip()
+            if quality.startswith("q="):
+                try:
+                    if float(quality[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(name.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    def matches(self, if_none_match):
+        """
+        Checks an If-None-Match header against the ETags of every variant of this payload.
+
+        :param if_none_match: The value of the If-None-Match request header.
+        :return: True if the client already holds this payload.
+        """
+        if not if_none_match:
+            return False
+        candidates = {tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+                      for tag in if_none_match.split(",")}
+        return "*" in candidates or not candidates.isdisjoint(self.etags.values())
+
+    def to_response(self, headers, status=200):
+        """
+        Builds the response for a request, answering 304 Not Modified when the client's copy is current.
+
+        :param headers: The request headers.
+        :param status: The status code for a full response.
+        :return: A Quart Response.
+        """
+        encoding = self.select_encoding(headers.get("Accept-Encoding"))
+        response_headers = {"ETag": self.etags[encoding], "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if self.matches(headers.get("If-None-Match")):
+            return Response(b"", status=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding], status=status, headers=response_headers,
+                        content_type="application/json")
+
+
+class PayloadCache:
+    """
+    Keeps the latest EncodedPayload per cache key, least recently used first out once the cache is full, and
+    drops payloads built from older data versions. Concurrent misses for the same key share one build.
+    """
+
+    def __init__(self, max_entries=PAYLOAD_CACHE_SIZE):
+        """
+        :param max_entries: The maximum number of payloads kept.
+        """
+        self.logger = logging.getLogger('quart_app.utils.payload_cache')
+        self.max_entries = max_entries
+        self._payloads = OrderedDict()
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def get(self, key, version):
+        """
+        Returns the payload for a key if it was built from the given data version.
+
+        :param key: The cache key.
+        :param version: The current data version.
+        :return: The cached EncodedPayload or None.
+        """
+        payload = self._payloads.get(key)
+        if payload is not None and payload.version == version:
+            self._payloads.move_to_end(key)
+            return payload
+        return None
+
+    def put(self, key, payload):
+        """
+        Stores a payload and evicts every payload built from an older data version, then the least recently
+        used ones beyond max_entries.
+
+        :param key: The cache key.
+        :param payload: The EncodedPayload to store.
+        """
+        stale = [k for k, cached in self._payloads.items() if cached.version < payload.version]
+        for k in stale:
+            del self._payloads[k]
+        self._payloads[key] = payload
+        self._payloads.move_to_end(key)
+        evicted = len(stale)
+        while len(self._payloads) > self.max_entries:
+            self._payloads.popitem(last=False)
+            evicted += 1
+        self.logger.debug(f"::put:: Cached payload {key} for version {payload.version}, evicted {evicted}.")
+
+    async def get_or_build(self, key, version, build):
+        """
+        Returns the payload for a key and data version, building it at most once at a time.
+
+        The build runs in an empty context, so it never shares a request-bound database session with the
+        request that happened to trigger it, and a cancelled request does not cancel it for the others.
+
+        :param key: The cache key.
+        :param version: The current data version.
+        :param build: Zero-argument coroutine function producing the EncodedPayload.
+        :return: The cached or freshly built EncodedPayload.
+        """
+        payload = self.get(key, version)
+        if payload is not None:
+            return payload
+        task = self._inflight.get((key, version))
+        if task is None:
+            task = contextvars.Context().run(asyncio.ensure_future, self._build(key, version, build))
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[(key, version)] = task
+        return await asyncio.shield(task)
+
+    async def _build(self, key, version, build):
+        try:
+            payload = await build()
+            self.put(key, payload)
+            return payload
+        finally:
+            self._inflight.pop((key, version), None)
@@ -1,8 +1,10 @@
 import os
-import requests
 from neo4j import GraphDatabase
 from datetime import datetime
 from dotenv import load_dotenv
+from geo_resolver import GeoResolver
+from node_classifier import CLASSIFIERS
+from node_writer import bump_data_version, lowercase_fields
 
 load_dotenv()
 
@@ -28,28 +30,6 @@ def get_nodes_with_null_latitude():
         return nodes
 
 
-def fetch_geo_info(ip):
-    url = f"https://api.ipgeolocation.io/ipgeo?apiKey={API_KEY}&ip={ip}"
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            geo_info = {
-                "latitude": data.get("latitude", None),
-                "longitude": data.get("longitude", None),
-                "isp": data.get("isp", None),
-                "country_name": data.get("country_name", None)
-            }
-            print(f"Geographic information retrieved for {ip}: {geo_info}")
-            return geo_info
-        else:
-            print(f"API response is not valid, status code: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error occurred while retrieving geographic information for {ip}: {e}")
-        return None
-
-
 def update_node_with_geo_info(node_id, geo_info):
     with driver.session() as session:
         session.run("""
@@ -57,15 +37,21 @@ def update_node_with_geo_info(node_id, geo_info):
             SET n.latitude = $latitude,
                 n.longitude = $longitude,
                 n.isp = $isp,
+                n.isp_category = $isp_category,
                 n.country_name = $country_name,
-                n.updated_at = $updated_at
+                n.isp_lower = $isp_lower,
+                n.country_name_lower = $country_name_lower,
+                n.updated_at = $updated_at,
+                n.hierarchy_changed_at = $updated_at
         """,
                     node_id=node_id,
                     latitude=geo_info['latitude'],
                     longitude=geo_info['longitude'],
                     isp=geo_info['isp'],
+                    isp_category=CLASSIFIERS['isp'].classify(geo_info['isp']),
                     country_name=geo_info['country_name'],
-                    updated_at=datetime.now().isoformat())
+                    updated_at=datetime.now().isoformat(),
+                    **lowercase_fields(isp=geo_info['isp'], country_name=geo_info['country_name']))
         print(f"Node {node_id} has been updated.")
 
 
@@ -73,10 +59,17 @@ def main():
     nodes = get_nodes_with_null_latitude()
     if nodes:
         print(f"{len(nodes)} nodes found.")
-        for node in nodes:
-            geo_info = fetch_geo_info(node['host'])
-            if geo_info:
-                update_node_with_geo_info(node['id'], geo_info)
+        with GeoResolver(API_KEY) as resolver:
+            resolver.prefetch(node['host'] for node in nodes)
+            updated = 0
+            for node in nodes:
+                geo_info = resolver.resolve(node['host'])
+                if geo_info:
+                    update_node_with_geo_info(node['id'], geo_info)
+                    updated += 1
+        if updated:
+            with driver.session() as session:
+                session.execute_write(bump_data_version)
     else:
         print("No nodes found with null latitude.")
 
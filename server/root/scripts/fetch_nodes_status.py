@@ -1,9 +1,9 @@
 import os
 import asyncio
-import socket
-from neo4j import GraphDatabase
-from concurrent.futures import ThreadPoolExecutor
+from neo4j import AsyncGraphDatabase
 from dotenv import load_dotenv
+from node_prober import NodeProber
+from node_writer import increment_node_statuses_async, bump_data_version_async
 
 load_dotenv()
 
@@ -14,60 +14,53 @@ NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD')
 if not all([NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD]):
     raise EnvironmentError("Required .env file values are missing! Please check the .env file.")
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+driver = AsyncGraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
 
 
-def check_port(host, port, timeout=3):
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(timeout)
-            result = sock.connect_ex((host, int(port)))
-            return result == 0
-    except socket.error as e:
-        print(f"Socket error for {host}:{port} - {e}")
-        return False
+async def get_nodes():
+    async with driver.session() as session:
+        result = await session.run("MATCH (n:Node) RETURN n.id AS nodeId, n.host AS host, n.port AS port")
+        return [(record["nodeId"], record["host"], record["port"]) async for record in result]
 
 
-def update_node_status(node_id, increment):
-    with driver.session() as session:
-        query = """
-        MATCH (n:Node {id: $node_id})
-        SET n.status = coalesce(n.status, 0) + $increment
-        """
-        session.run(query, node_id=node_id, increment=increment)
+async def update_node_statuses(rows):
+    async with driver.session() as session:
+        await session.execute_write(increment_node_statuses_async, rows)
 
 
-async def check_nodes(executor):
-    with driver.session() as session:
-        result = session.run("MATCH (n:Node) RETURN n.id AS nodeId, n.host AS host, n.port AS port")
-        nodes = [(record["nodeId"], record["host"], record["port"]) for record in result]
+async def check_nodes():
+    nodes = await get_nodes()
+    print(f"{len(nodes)} nodes found.")
+    prober = NodeProber()
+    results = await prober.probe_many((host, port) for _, host, port in nodes)
+    rows = [{'id': node_id, 'increment': 0 if online else 1} for (node_id, _, _), online in zip(nodes, results)]
+    online_count = sum(1 for online in results if online)
+    print(f"{online_count} nodes online, {len(nodes) - online_count} nodes offline.")
+    await update_node_statuses(rows)
 
-    loop = asyncio.get_running_loop()
-    tasks = []
-    for node_id, host, port in nodes:
-        task = loop.run_in_executor(executor, check_and_update, node_id, host, port)
-        tasks.append(task)
 
-    await asyncio.gather(*tasks)
+async def delete_offline_nodes_tx(tx):
+    result = await tx.run("MATCH (n:Node) WHERE n.status >= 24 DETACH DELETE n")
+    summary = await result.consume()
+    if summary.counters.nodes_deleted:
+        await bump_data_version_async(tx)
+        await bump_data_version_async(tx, 'relationships')
+    return summary.counters.nodes_deleted
 
 
-def check_and_update(node_id, host, port):
-    if check_port(host, port):
-        update_node_status(node_id, 0)
-        print(f"Node {node_id} at {host}:{port} is online.")
-    else:
-        update_node_status(node_id, 1)
-        print(f"Node {node_id} at {host}:{port} is offline.")
+async def delete_offline_nodes():
+    async with driver.session() as session:
+        deleted = await session.execute_write(delete_offline_nodes_tx)
+        print(f"{deleted} offline nodes deleted.")
 
 
-def delete_offline_nodes():
-    with driver.session() as session:
-        session.run("MATCH (n:Node)-[r]->() WHERE n.status >= 24 DELETE r")
-        session.run("MATCH (n:Node)<-[r]-() WHERE n.status >= 24 DELETE r")
-        session.run("MATCH (n:Node) WHERE n.status >= 24 DELETE n")
+async def main():
+    try:
+        await check_nodes()
+        await delete_offline_nodes()
+    finally:
+        await driver.close()
 
 
 if __name__ == "__main__":
-    executor = ThreadPoolExecutor()
-    asyncio.run(check_nodes(executor))
-    delete_offline_nodes()
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import os
+import csv
+import ipaddress
+import socket
+from array import array
+from bisect import bisect_right
+
+RANGE_FIELDS = ("country_name", "isp", "latitude", "longitude")
+
+
+def ip_to_int(ip):
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+
+
+class IpRangeDatabase:
+    """
+    Offline IP geolocation from a CSV of non-overlapping networks with the header
+    network,country_name,isp,latitude,longitude (e.g. 1.0.0.0/24,Australia,Cloudflare,-33.49,143.21).
+
+    Each address family is kept as sorted range starts and ends plus an index into a table of distinct
+    geo records, so a lookup is one bisection.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._starts = {4: array('L'), 6: []}
+        self._ends = {4: array('L'), 6: []}
+        self._record_ids = {4: array('L'), 6: array('L')}
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+    @classmethod
+    def load(cls, path):
+        ranges = {4: [], 6: []}
+        interned = {}
+        database = cls()
+        with open(path, newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                try:
+                    network = ipaddress.ip_network(row["network"].strip(), strict=False)
+                except (KeyError, ValueError):
+                    continue
+                record = tuple((row.get(field) or "").strip() or None for field in RANGE_FIELDS)
+                if record not in interned:
+                    interned[record] = len(database.records)
+                    database.records.append(dict(zip(RANGE_FIELDS, record)))
+                ranges[network.version].append(
+                    (int(network.network_address), int(network.broadcast_address), interned[record]))
+        skipped = 0
+        for version, rows in ranges.items():
+            rows.sort()
+            last_end = -1
+            for start, end, record_id in rows:
+                if start <= last_end:
+                    skipped += 1
+                    continue
+                database._starts[version].append(start)
+                database._ends[version].append(end)
+                database._record_ids[version].append(record_id)
+                last_end = end
+        print(f"{len(database)} IP ranges loaded from {path}, {skipped} overlapping ranges skipped.")
+        return database
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv('GEO_RANGES_PATH')
+        if not path:
+            return None
+        if not os.path.exists(path):
+            print(f"GEO_RANGES_PATH {path} does not exist, offline geolocation disabled.")
+            return None
+        return cls.load(path)
+
+    def lookup(self, ip):
+        try:
+            version, value = ip_to_int(ip)
+        except (OSError, TypeError):
+            return None
+        index = bisect_right(self._starts[version], value) - 1
+        if index < 0 or value > self._ends[version][index]:
+            return None
+        return self.records[self._record_ids[version][index]]
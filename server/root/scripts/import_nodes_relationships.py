@@ -1,6 +1,11 @@
 import os
+import argparse
+from datetime import datetime
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from node_classifier import classify_node
+from node_writer import bump_data_version, LOWERCASE_PROPERTIES
+from neo4j_schema import ensure_schema
 
 load_dotenv()
 
@@ -13,64 +18,127 @@ if not all([NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD]):
 
 driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
 
-cypher_query = """
+RELATIONSHIP_BATCH_SIZE = int(os.getenv('RELATIONSHIP_BATCH_SIZE', '1000'))
+
+changed_nodes_query = """
 MATCH (n:Node)
+WHERE n.country_name IS NOT NULL
+  AND ($watermark IS NULL OR coalesce(n.hierarchy_changed_at, n.created_at) > $watermark)
+RETURN n.id AS id
+"""
+
+unclassified_nodes_query = """
+MATCH (n:Node)
+WHERE $full OR n.isp_category IS NULL OR n.os_category IS NULL OR n.client_category IS NULL
+RETURN n.id AS id, n.client AS client, n.os AS os, n.isp AS isp
+"""
+
+classify_nodes_query = """
+UNWIND $rows AS row
+MATCH (n:Node {id: row.id})
+SET n.isp_category = row.isp_category, n.os_category = row.os_category, n.client_category = row.client_category
+"""
+
+lowercase_nodes_query = """
+MATCH (n:Node)
+WHERE $full OR """ + " OR ".join(f"(n.{prop} IS NOT NULL AND n.{prop}_lower IS NULL)" for prop in LOWERCASE_PROPERTIES) + """
+CALL {
+    WITH n
+    SET """ + ", ".join(f"n.{prop}_lower = toLower(n.{prop})" for prop in LOWERCASE_PROPERTIES) + """
+} IN TRANSACTIONS OF 1000 ROWS
+"""
+
+cypher_query = """
+UNWIND $ids AS node_id
+MATCH (n:Node {id: node_id})
+WHERE n.country_name IS NOT NULL
 WITH n,
-    COALESCE(n.country_name) AS country_name,
-    CASE
-        WHEN toLower(n.isp) CONTAINS 'contabo' THEN 'Contabo'
-        WHEN toLower(n.isp) CONTAINS 'aws' OR toLower(n.isp) CONTAINS 'amazon' THEN 'AWS'
-        WHEN toLower(n.isp) CONTAINS 'azure' OR toLower(n.isp) CONTAINS 'microsoft' THEN 'Azure'
-        WHEN toLower(n.isp) CONTAINS 'google' THEN 'Google'
-        WHEN toLower(n.isp) CONTAINS 'alibaba' THEN 'Alibaba'
-        WHEN toLower(n.isp) CONTAINS 'oracle' THEN 'Oracle'
-        WHEN toLower(n.isp) CONTAINS 'ibm' THEN 'IBM'
-        WHEN toLower(n.isp) CONTAINS 'tencent' THEN 'Tencent'
-        WHEN toLower(n.isp) CONTAINS 'ovh' THEN 'OVHCloud'
-        WHEN toLower(n.isp) CONTAINS 'digitalocean' THEN 'DigitalOcean'
-        WHEN toLower(n.isp) CONTAINS 'linode' OR toLower(n.isp) CONTAINS 'akamai' THEN 'Linode'
-        WHEN toLower(n.isp) CONTAINS 'akamai' THEN 'Linode'
-        WHEN toLower(n.isp) CONTAINS 'salesforce' THEN 'Salesforce'
-        WHEN toLower(n.isp) CONTAINS 'huawei' AND toLower(n.isp) CONTAINS 'cloud' THEN 'Huawei'
-        WHEN toLower(n.isp) CONTAINS 'dell' AND toLower(n.isp) CONTAINS 'cloud' THEN 'Dell'
-        WHEN toLower(n.isp) CONTAINS 'vultr' THEN 'Vultr'
-        WHEN toLower(n.isp) CONTAINS 'heroku' THEN 'Heroku'
-        WHEN toLower(n.isp) CONTAINS 'hetzner' THEN 'Hetzner'
-        WHEN toLower(n.isp) CONTAINS 'scaleway' THEN 'Scaleway'
-        WHEN toLower(n.isp) CONTAINS 'upcloud' THEN 'Upcloud'
-        WHEN toLower(n.isp) CONTAINS 'kamatera' THEN 'Kamatera'
-        ELSE "Other ISPs"
-    END AS isp_name,
-    CASE
-        WHEN toLower(n.os) CONTAINS 'linux' THEN 'Linux'
-        WHEN toLower(n.os) CONTAINS 'windows' THEN 'Windows'
-        WHEN toLower(n.os) CONTAINS 'macos' THEN 'MacOS'
-        ELSE "Other OSs"
-    END AS os_name,
-    CASE
-        WHEN toLower(n.client) CONTAINS 'geth' THEN 'Geth'
-        WHEN toLower(n.client) CONTAINS 'nethermind' THEN 'Nethermind'
-        WHEN toLower(n.client) CONTAINS 'besu' THEN 'Besu'
-        WHEN toLower(n.client) CONTAINS 'erigon' THEN 'Erigon'
-        WHEN toLower(n.client) CONTAINS 'reth' THEN 'Reth'
-        WHEN toLower(n.client) CONTAINS 'ethereumjs' THEN 'EthereumJS'
-        ELSE 'Other Clients'
-    END AS client_name
+    n.country_name AS country_name,
+    coalesce(n.isp_category, 'Other ISPs') AS isp_name,
+    coalesce(n.os_category, 'Other OSs') AS os_name,
+    coalesce(n.client_category, 'Other Clients') AS client_name
 MATCH (root:Root {name: 'World'})
 MERGE (country:Country {name: country_name})<-[:HAS_COUNTRY]-(root)
 MERGE (country)-[:HAS_ISP]->(isp:ISP {name: isp_name})
 MERGE (isp)-[:HAS_OS]->(os:OS {name: os_name})
 MERGE (os)-[:HAS_CLIENT]->(client:Client {name: client_name})
+WITH n, client
+OPTIONAL MATCH (:Client)-[stale:HAS_NODE]->(n)
+WHERE startNode(stale) <> client
+DELETE stale
+WITH DISTINCT n, client
 MERGE (client)-[:HAS_NODE]->(n)
 """
 
+prune_queries = [
+    "MATCH (client:Client) WHERE NOT (client)-[:HAS_NODE]->() DETACH DELETE client",
+    "MATCH (os:OS) WHERE NOT (os)-[:HAS_CLIENT]->() DETACH DELETE os",
+    "MATCH (isp:ISP) WHERE NOT (isp)-[:HAS_OS]->() DETACH DELETE isp",
+    "MATCH (country:Country) WHERE NOT (country)-[:HAS_ISP]->() DETACH DELETE country",
+]
 
-def execute_relationship_query(driver, query):
+
+def write_categories(tx, rows):
+    tx.run(classify_nodes_query, rows=rows).consume()
+    bump_data_version(tx)
+
+
+def classify_nodes(session, full=False):
+    rows = [
+        {"id": record["id"], **classify_node(record["client"], record["os"], record["isp"])}
+        for record in session.run(unclassified_nodes_query, full=full)
+    ]
+    for start in range(0, len(rows), RELATIONSHIP_BATCH_SIZE):
+        batch = rows[start:start + RELATIONSHIP_BATCH_SIZE]
+        session.execute_write(write_categories, batch)
+    print(f"{len(rows)} nodes classified.")
+    return [row["id"] for row in rows]
+
+
+def get_watermark(session):
+    record = session.run("MATCH (m:Meta {name: 'relationships'}) RETURN m.watermark AS watermark").single()
+    return record["watermark"] if record else None
+
+
+def set_watermark(session, watermark):
+    session.run("MERGE (m:Meta {name: 'relationships'}) SET m.watermark = $watermark", watermark=watermark)
+
+
+def link_nodes(tx, ids):
+    tx.run(cypher_query, ids=ids).consume()
+    bump_data_version(tx, 'relationships')
+
+
+def execute_relationship_query(driver, full=False):
+    started_at = datetime.now().isoformat()
     with driver.session() as session:
-        session.run(query)
+        ensure_schema(session)
+        session.run("MERGE (root:Root {name: 'World'})")
+        watermark = None if full else get_watermark(session)
+        classified = classify_nodes(session, full=full)
+        lowered = session.run(lowercase_nodes_query, full=full).consume().counters.properties_set
+        if lowered:
+            print(f"{lowered} lower-cased filter properties backfilled.")
+        ids = [record["id"] for record in session.run(changed_nodes_query, watermark=watermark)]
+        ids = list(dict.fromkeys(ids + classified))
+        print(f"{len(ids)} nodes changed since {watermark or 'the beginning'}.")
+        for start in range(0, len(ids), RELATIONSHIP_BATCH_SIZE):
+            batch = ids[start:start + RELATIONSHIP_BATCH_SIZE]
+            session.execute_write(link_nodes, batch)
+            print(f"Relationships created for {start + len(batch)}/{len(ids)} nodes.")
+        pruned = sum(session.run(query).consume().counters.nodes_deleted for query in prune_queries)
+        if pruned:
+            session.execute_write(bump_data_version, 'relationships')
+            print(f"{pruned} empty hierarchy nodes pruned.")
+        set_watermark(session, started_at)
     print("Relationships created successfully.")
 
 
-execute_relationship_query(driver, cypher_query)
-
-driver.close()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Links nodes into the Country/ISP/OS/Client hierarchy.")
+    parser.add_argument("--full", action="store_true", help="relink every node instead of only changed ones")
+    args = parser.parse_args()
+    try:
+        execute_relationship_query(driver, full=args.full)
+    finally:
+        driver.close()
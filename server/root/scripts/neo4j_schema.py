@@ -0,0 +1,113 @@
+import os
+from datetime import datetime
+from neo4j import GraphDatabase
+from dotenv import load_dotenv
+from node_classifier import CATEGORY_PROPERTIES
+from node_writer import LOWERCASE_PROPERTIES, bump_data_version, bump_data_version_async
+
+# (name, kind, label, property); kind is "unique" for a uniqueness constraint or "index" for a range index.
+# This is the only definition; api/db/neo4j_schema.py imports it to bootstrap the same schema when the API starts.
+SCHEMA = (
+    ("node_id", "unique", "Node", "id"),
+    ("meta_name", "unique", "Meta", "name"),
+    ("root_name", "index", "Root", "name"),
+    ("country_name", "index", "Country", "name"),
+    ("isp_name", "index", "ISP", "name"),
+    ("os_name", "index", "OS", "name"),
+    ("client_name", "index", "Client", "name"),
+    ("node_created_at", "index", "Node", "created_at"),
+    ("node_hierarchy_changed_at", "index", "Node", "hierarchy_changed_at"),
+    ("node_status", "index", "Node", "status"),
+    *((f"node_{prop}", "index", "Node", prop) for prop in CATEGORY_PROPERTIES),
+    *((f"node_{prop}_lower", "index", "Node", f"{prop}_lower") for prop in LOWERCASE_PROPERTIES),
+)
+
+# Node ids written before the uniqueness constraint existed may be duplicated by the old check-then-CREATE race.
+# The most recently written copy is kept with the earliest created_at and marked for relinking; the others and
+# their hierarchy relationships are deleted.
+DEDUPLICATE_NODES_QUERY = """
+MATCH (n:Node)
+WHERE n.id IS NOT NULL
+WITH n ORDER BY coalesce(n.updated_at, n.created_at) DESC
+WITH n.id AS id, collect(n) AS nodes, min(n.created_at) AS created_at
+WHERE size(nodes) > 1
+WITH nodes[0] AS keep, nodes[1..] AS duplicates, created_at
+SET keep.created_at = created_at, keep.hierarchy_changed_at = $now
+FOREACH (duplicate IN duplicates | DETACH DELETE duplicate)
+"""
+
+
+def schema_statement(name, kind, label, prop):
+    if kind == "unique":
+        return f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE"
+    return f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})"
+
+
+def missing_schema(session):
+    existing = {record["name"] for record in session.run("SHOW CONSTRAINTS YIELD name")}
+    existing |= {record["name"] for record in session.run("SHOW INDEXES YIELD name, state WHERE state = 'ONLINE'")}
+    return [name for name, _, _, _ in SCHEMA if name not in existing]
+
+
+def ensure_schema(session):
+    if "node_id" in missing_schema(session):
+        deleted = session.run(DEDUPLICATE_NODES_QUERY, now=datetime.now().isoformat()).consume().counters.nodes_deleted
+        if deleted:
+            session.execute_write(bump_data_version)
+            session.execute_write(bump_data_version, 'relationships')
+            print(f"{deleted} duplicate nodes merged before creating the node_id constraint.")
+    for name, kind, label, prop in SCHEMA:
+        try:
+            session.run(schema_statement(name, kind, label, prop)).consume()
+        except Exception as e:
+            print(f"Could not create {name}: {e}")
+    missing = missing_schema(session)
+    if "node_id" in missing:
+        raise RuntimeError("The node_id uniqueness constraint could not be created; MERGE on Node.id is not race-safe without it.")
+    if missing:
+        print(f"Schema incomplete, missing or not yet online: {', '.join(missing)}")
+    return missing
+
+
+async def missing_schema_async(session):
+    result = await session.run("SHOW CONSTRAINTS YIELD name")
+    existing = {record["name"] async for record in result}
+    result = await session.run("SHOW INDEXES YIELD name, state WHERE state = 'ONLINE'")
+    existing |= {record["name"] async for record in result}
+    return [name for name, _, _, _ in SCHEMA if name not in existing]
+
+
+async def ensure_schema_async(session):
+    if "node_id" in await missing_schema_async(session):
+        result = await session.run(DEDUPLICATE_NODES_QUERY, now=datetime.now().isoformat())
+        deleted = (await result.consume()).counters.nodes_deleted
+        if deleted:
+            await session.execute_write(bump_data_version_async)
+            await session.execute_write(bump_data_version_async, 'relationships')
+            print(f"{deleted} duplicate nodes merged before creating the node_id constraint.")
+    for name, kind, label, prop in SCHEMA:
+        try:
+            result = await session.run(schema_statement(name, kind, label, prop))
+            await result.consume()
+        except Exception as e:
+            print(f"Could not create {name}: {e}")
+    missing = await missing_schema_async(session)
+    if "node_id" in missing:
+        raise RuntimeError("The node_id uniqueness constraint could not be created; MERGE on Node.id is not race-safe without it.")
+    return missing
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    NEO4J_URI = os.getenv('NEO4J_URI')
+    NEO4J_USER = os.getenv('NEO4J_USER')
+    NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD')
+    if not all([NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD]):
+        raise EnvironmentError("Required .env file values are missing! Please check the .env file.")
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    try:
+        with driver.session() as session:
+            if not ensure_schema(session):
+                print("All constraints and indexes are in place.")
+    finally:
+        driver.close()
@@ -0,0 +1,214 @@
+import os
+import asyncio
+import threading
+import time
+from datetime import datetime
+from node_classifier import CLASSIFIERS
+
+# The values a node is linked into the Country/ISP/OS/Client hierarchy by, as the relationship import reads them.
+HIERARCHY_KEY = """[coalesce(n.country_name, ''), coalesce(n.isp_category, 'Other ISPs'),
+     coalesce(n.os_category, 'Other OSs'), coalesce(n.client_category, 'Other Clients')]"""
+
+# Values a scrape did not observe, such as the geo fields of an unresolved node, are None in the row and keep
+# the stored properties and their derived categories and lower-cased copies. hierarchy_changed_at only moves
+# when the node's place in the hierarchy does, so the relationship import relinks just those nodes.
+UPSERT_NODES_QUERY = """
+UNWIND $rows AS row
+MERGE (n:Node {id: row.id})
+ON CREATE SET n.created_at = $now, n.hierarchy_changed_at = $now
+WITH n, row, """ + HIERARCHY_KEY + """ AS linked
+SET n.host = coalesce(row.host, n.host), n.port = coalesce(row.port, n.port),
+    n.client = coalesce(row.client, n.client), n.os = coalesce(row.os, n.os),
+    n.latitude = coalesce(row.latitude, n.latitude), n.longitude = coalesce(row.longitude, n.longitude),
+    n.isp = coalesce(row.isp, n.isp), n.country_name = coalesce(row.country_name, n.country_name),
+    n.isp_category = coalesce(row.isp_category, n.isp_category),
+    n.os_category = coalesce(row.os_category, n.os_category),
+    n.client_category = coalesce(row.client_category, n.client_category),
+    n.country_name_lower = coalesce(row.country_name_lower, n.country_name_lower),
+    n.isp_lower = coalesce(row.isp_lower, n.isp_lower), n.os_lower = coalesce(row.os_lower, n.os_lower),
+    n.client_lower = coalesce(row.client_lower, n.client_lower),
+    n.status = row.status, n.updated_at = $now
+WITH n, linked
+WHERE linked <> """ + HIERARCHY_KEY + """
+SET n.hierarchy_changed_at = $now
+"""
+
+INCREMENT_STATUS_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Node {id: row.id})
+SET n.status = coalesce(n.status, 0) + row.increment
+"""
+
+BUMP_VERSION_QUERY = """
+MERGE (m:Meta {name: $name})
+SET m.version = coalesce(m.version, 0) + 1, m.changed_at = $now
+"""
+
+# Lower-cased copies of the filterable properties, so case-insensitive filters can seek an index.
+LOWERCASE_PROPERTIES = ('country_name', 'isp', 'os', 'client')
+
+
+def lowercase_fields(**values):
+    return {f"{prop}_lower": value.lower() if isinstance(value, str) else None for prop, value in values.items()}
+
+
+def observed_categories(**values):
+    return {CLASSIFIERS[dimension].prop: CLASSIFIERS[dimension].classify(value) if value else None
+            for dimension, value in values.items()}
+
+
+def make_node_row(node_id, host, port, client, os, status, geo_info=None):
+    geo_info = geo_info or {}
+    return {
+        'id': node_id,
+        'host': host,
+        'port': port,
+        'client': client,
+        'os': os,
+        'status': status,
+        'latitude': geo_info.get('latitude'),
+        'longitude': geo_info.get('longitude'),
+        'isp': geo_info.get('isp'),
+        'country_name': geo_info.get('country_name'),
+        **observed_categories(client=client, os=os, isp=geo_info.get('isp')),
+        **lowercase_fields(country_name=geo_info.get('country_name'), isp=geo_info.get('isp'), os=os, client=client),
+    }
+
+
+def bump_data_version(tx, name='nodes'):
+    tx.run(BUMP_VERSION_QUERY, name=name, now=datetime.now().isoformat()).consume()
+
+
+async def bump_data_version_async(tx, name='nodes'):
+    result = await tx.run(BUMP_VERSION_QUERY, name=name, now=datetime.now().isoformat())
+    await result.consume()
+
+
+def upsert_nodes(tx, rows):
+    tx.run(UPSERT_NODES_QUERY, rows=rows, now=datetime.now().isoformat()).consume()
+    bump_data_version(tx)
+
+
+async def upsert_nodes_async(tx, rows):
+    result = await tx.run(UPSERT_NODES_QUERY, rows=rows, now=datetime.now().isoformat())
+    await result.consume()
+    await bump_data_version_async(tx)
+
+
+async def increment_node_statuses_async(tx, rows):
+    result = await tx.run(INCREMENT_STATUS_QUERY, rows=rows)
+    await result.consume()
+    await bump_data_version_async(tx)
+
+
+def _default_batch_size():
+    return int(os.getenv('WRITE_BATCH_SIZE', '500'))
+
+
+def _default_flush_interval():
+    return float(os.getenv('WRITE_FLUSH_INTERVAL', '5'))
+
+
+class NodeWriter:
+    """
+    Thread-safe node writer for the synchronous driver. Rows are buffered and upserted with one UNWIND
+    statement once batch_size rows are pending or flush_interval seconds passed since the last flush.
+    """
+
+    def __init__(self, driver, batch_size=None, flush_interval=None):
+        self.driver = driver
+        self.batch_size = batch_size or _default_batch_size()
+        self.flush_interval = flush_interval or _default_flush_interval()
+        self.written = 0
+        self._rows = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            due = (len(self._rows) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._last_flush = time.monotonic()
+        if not rows:
+            return
+        try:
+            with self.driver.session() as session:
+                session.execute_write(upsert_nodes, rows)
+        except Exception as e:
+            print(f"Error writing {len(rows)} nodes to the database: {e}")
+            return
+        with self._lock:
+            self.written += len(rows)
+        print(f"{len(rows)} nodes written to the database.")
+
+
+class AsyncNodeWriter:
+    """
+    Single writer task for the async driver. Producers enqueue rows with add(); the task upserts them with
+    one UNWIND statement per batch, flushing when a batch is full or flush_interval seconds passed since the last
+    flush, so a steady trickle of rows cannot hold a partial batch back.
+    """
+
+    def __init__(self, driver, batch_size=None, flush_interval=None):
+        self.driver = driver
+        self.batch_size = batch_size or _default_batch_size()
+        self.flush_interval = flush_interval or _default_flush_interval()
+        self.written = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._queue.put(None)
+        await self._task
+
+    async def add(self, row):
+        await self._queue.put(row)
+
+    async def flush(self, rows):
+        async with self.driver.session() as session:
+            await session.execute_write(upsert_nodes_async, rows)
+        self.written += len(rows)
+        print(f"{len(rows)} nodes written to the database.")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        last_flush = loop.time()
+        while True:
+            timeout = max(0.0, last_flush + self.flush_interval - loop.time()) if batch else None
+            finished = False
+            try:
+                row = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                if row is None:
+                    finished = True
+                else:
+                    batch.append(row)
+            except asyncio.TimeoutError:
+                pass
+            if batch and (finished or len(batch) >= self.batch_size
+                          or loop.time() - last_flush >= self.flush_interval):
+                try:
+                    await self.flush(batch)
+                except Exception as e:
+                    print(f"Error writing {len(batch)} nodes to the database: {e}")
+                batch = []
+                last_flush = loop.time()
+            if finished:
+                return